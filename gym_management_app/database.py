@@ -1,20 +1,159 @@
+import os
+import heapq
 import sqlite3
-from datetime import datetime
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from utils.text_utils import normalize_name, phone_digits, is_phone_like, trigrams
+from utils.barcode_cache import barcode_index, BarcodeEntry
+from utils.client_cache import client_cache
+from utils.attendance_cache import today_checkins, occupancy
+
+# Connection settings
+DB_PATH = "gym_management.db"
+BUSY_TIMEOUT_MS = 5000
+
+# One long-lived connection per thread
+_local = threading.local()
+_connections = {}  # connection -> owning thread
+_connections_lock = threading.Lock()
+_generation = 0
+
+def configure(db_path=None, busy_timeout_ms=None):
+    """Configure database path and busy timeout (closes pooled connections)"""
+    global DB_PATH, BUSY_TIMEOUT_MS
+    close_all_connections()
+    if db_path is not None:
+        DB_PATH = db_path
+    if busy_timeout_ms is not None:
+        BUSY_TIMEOUT_MS = busy_timeout_ms
+
+def _open_connection():
+    """Open a new connection with tuned pragmas"""
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        isolation_level=None,  # Transactions are managed by transaction()
+        check_same_thread=False
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-16000")  # ~16MB page cache
+    conn.execute(f"PRAGMA busy_timeout={int(BUSY_TIMEOUT_MS)}")
+    return conn
 
 def get_connection():
-    """Get database connection"""
+    """Get the pooled database connection for the current thread"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.generation == _generation:
+        return conn
     try:
-        conn = sqlite3.connect("gym_management.db")
+        conn = _open_connection()
+        _local.conn = conn
+        _local.depth = 0
+        _local.generation = _generation
+        with _connections_lock:
+            _connections[conn] = threading.current_thread()
+            # Release connections left behind by threads that have exited
+            dead = [other for other, thread in _connections.items() if not thread.is_alive()]
+            for other in dead:
+                del _connections[other]
+        for other in dead:
+            _release(other)
         return conn
     except sqlite3.Error as e:
         print(f"Database connection error: {e}")
         return None
 
-def init_db():
-    """Initialize database tables"""
+@contextmanager
+def transaction(immediate=False):
+    """Yield the pooled connection inside a transaction.
+
+    Commits on success and rolls back on error. Nested calls join the
+    outermost transaction.
+    """
     conn = get_connection()
-    if conn:
+    if conn is None:
+        raise sqlite3.OperationalError("no database connection")
+    
+    depth = _local.depth
+    if depth == 0:
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        _local.on_commit = []
+    _local.depth = depth + 1
+    try:
+        yield conn
+    except BaseException:
+        _local.depth = depth
+        if depth == 0:
+            _local.on_commit = []
+            conn.rollback()
+        raise
+    _local.depth = depth
+    if depth == 0:
+        callbacks, _local.on_commit = _local.on_commit, []
         try:
+            conn.commit()
+        except BaseException:
+            # Leave the pooled connection usable (SQLITE_BUSY, disk full, ...)
+            conn.rollback()
+            raise
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error in after-commit callback: {e}")
+
+def after_commit(callback):
+    """Run callback once the current transaction commits (dropped on rollback).
+    
+    Used to update in-memory caches only with data that was really written.
+    Outside a transaction the callback runs at once.
+    """
+    if getattr(_local, "depth", 0) == 0:
+        callback()
+    else:
+        _local.on_commit.append(callback)
+
+def _release(conn):
+    """Close a pooled connection that is no longer in the pool"""
+    client_cache.forget_connection(conn)
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+def close_connection():
+    """Close the pooled connection of the current thread (call before a thread exits)"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        with _connections_lock:
+            _connections.pop(conn, None)
+        _release(conn)
+        _local.conn = None
+        _local.depth = 0
+
+def close_all_connections():
+    """Close every pooled connection (application shutdown)"""
+    global _generation
+    with _connections_lock:
+        _generation += 1
+        connections = list(_connections)
+        _connections.clear()
+    for conn in connections:
+        _release(conn)
+    _local.conn = None
+    _local.depth = 0
+    client_cache.clear()
+    today_checkins.clear()
+    occupancy.clear()
+
+def init_db():
+    """Initialize database tables"""
+    try:
+        with transaction() as conn:
             cursor = conn.cursor()
             
             # Create clients table
@@ -58,193 +197,1518 @@ def init_db():
             )
             """)
             
-            conn.commit()
-            print("Database initialized successfully!")
-            
-        except Exception as e:
-            print(f"Error initializing database: {e}")
+        run_migrations()
+        print("Database initialized successfully!")
+        
+    except Exception as e:
+        print(f"Error initializing database: {e}")
+
+# Schema migrations
+def _add_query_indexes(conn):
+    """Indexes for attendance by date/client, barcode by client and client ordering"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance(date, check_in_time)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_client_date ON attendance(client_id, date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_barcodes_client ON barcodes(client_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_clients_name ON clients(name)")
+
+def _add_client_search_index(conn):
+    """Normalized name/phone search columns, and an FTS5 index over them kept in sync by triggers"""
+    conn.execute("ALTER TABLE clients ADD COLUMN name_search TEXT")
+    conn.execute("ALTER TABLE clients ADD COLUMN phone_digits TEXT")
+    
+    # Backfill existing clients
+    rows = conn.execute("SELECT id, name, phone FROM clients").fetchall()
+    conn.executemany(
+        "UPDATE clients SET name_search=?, phone_digits=? WHERE id=?",
+        [(normalize_name(name), phone_digits(phone), client_id) for client_id, name, phone in rows]
+    )
+    
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_clients_name_search ON clients(name_search)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_clients_phone_digits ON clients(phone_digits)")
+    
+    try:
+        conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS clients_fts USING fts5(
+            name_search, phone_digits, email,
+            content='clients', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+        """)
+    except sqlite3.OperationalError as e:
+        # SQLite built without FTS5; ClientDB.search falls back to the normalized key indexes
+        print(f"Warning: client search index not available: {e}")
+        return
+    
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS clients_fts_insert AFTER INSERT ON clients BEGIN
+        INSERT INTO clients_fts(rowid, name_search, phone_digits, email)
+        VALUES (new.id, new.name_search, new.phone_digits, new.email);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS clients_fts_delete AFTER DELETE ON clients BEGIN
+        INSERT INTO clients_fts(clients_fts, rowid, name_search, phone_digits, email)
+        VALUES ('delete', old.id, old.name_search, old.phone_digits, old.email);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS clients_fts_update AFTER UPDATE OF name_search, phone_digits, email ON clients BEGIN
+        INSERT INTO clients_fts(clients_fts, rowid, name_search, phone_digits, email)
+        VALUES ('delete', old.id, old.name_search, old.phone_digits, old.email);
+        INSERT INTO clients_fts(rowid, name_search, phone_digits, email)
+        VALUES (new.id, new.name_search, new.phone_digits, new.email);
+    END
+    """)
+    
+    # Index existing clients
+    conn.execute("INSERT INTO clients_fts(clients_fts) VALUES ('rebuild')")
+
+def _add_client_trigrams(conn):
+    """Trigram index on normalized client names for fuzzy matching"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS client_trigrams (
+        trigram TEXT NOT NULL,
+        client_id INTEGER NOT NULL,
+        PRIMARY KEY (trigram, client_id)
+    ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_client_trigrams_client ON client_trigrams(client_id)")
+    conn.execute("ALTER TABLE clients ADD COLUMN trigram_count INTEGER DEFAULT 0")
+    
+    # Index existing clients
+    rows = conn.execute("SELECT id, name_search FROM clients").fetchall()
+    for client_id, name_search in rows:
+        _index_trigrams(conn, client_id, name_search)
+
+def _add_client_status_index(conn):
+    """Index for status-filtered client listings ordered by name"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_clients_status_name ON clients(status, name)")
+
+def _add_barcode_images(conn):
+    """Track barcode images kept in the sharded image store"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS barcode_images (
+        barcode_data TEXT PRIMARY KEY,
+        digest TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+def _add_data_versions(conn):
+    """Per-table change counters maintained by triggers (read by the client cache)"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS data_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    conn.execute("INSERT OR IGNORE INTO data_versions (name) VALUES ('clients')")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS clients_version_{event.lower()} AFTER {event} ON clients BEGIN
+            UPDATE data_versions SET version = version + 1 WHERE name = 'clients';
+        END
+        """)
+
+def _add_attendance_client_time_index(conn):
+    """Index for per-client history pages and visit summaries"""
+    conn.execute("""
+    CREATE INDEX IF NOT EXISTS idx_attendance_client_time
+    ON attendance(client_id, check_in_time)
+    """)
+
+# Attendance rollups: visits per day, per day and hour, and per day and
+# subscription type (the client's current type; visits of deleted clients
+# are not counted there). Rows without a date or check-in time are skipped.
+ROLLUP_TABLES = ("attendance_daily", "attendance_hourly", "attendance_by_type")
+
+def _rollup_add_sql(row):
+    """Trigger statements counting the attendance row NEW or OLD in"""
+    return f"""
+    INSERT INTO attendance_daily (date, visits)
+    SELECT {row}.date, 1 WHERE {row}.date IS NOT NULL AND {row}.check_in_time IS NOT NULL
+    ON CONFLICT(date) DO UPDATE SET visits = visits + 1;
+    INSERT INTO attendance_hourly (date, hour, visits)
+    SELECT {row}.date, CAST(strftime('%H', {row}.check_in_time) AS INTEGER), 1
+    WHERE {row}.date IS NOT NULL AND {row}.check_in_time IS NOT NULL
+    ON CONFLICT(date, hour) DO UPDATE SET visits = visits + 1;
+    INSERT INTO attendance_by_type (date, subscription_type, visits)
+    SELECT {row}.date, subscription_type, 1 FROM clients
+    WHERE id = {row}.client_id AND {row}.date IS NOT NULL AND {row}.check_in_time IS NOT NULL
+    ON CONFLICT(date, subscription_type) DO UPDATE SET visits = visits + 1;
+    """
+
+def _rollup_remove_sql(row):
+    """Trigger statements counting the attendance row NEW or OLD out"""
+    hour = f"CAST(strftime('%H', {row}.check_in_time) AS INTEGER)"
+    subscription_type = f"(SELECT subscription_type FROM clients WHERE id = {row}.client_id)"
+    return f"""
+    UPDATE attendance_daily SET visits = visits - 1 WHERE date = {row}.date;
+    DELETE FROM attendance_daily WHERE date = {row}.date AND visits <= 0;
+    UPDATE attendance_hourly SET visits = visits - 1 WHERE date = {row}.date AND hour = {hour};
+    DELETE FROM attendance_hourly WHERE date = {row}.date AND hour = {hour} AND visits <= 0;
+    UPDATE attendance_by_type SET visits = visits - 1
+    WHERE date = {row}.date AND subscription_type = {subscription_type};
+    DELETE FROM attendance_by_type
+    WHERE date = {row}.date AND subscription_type = {subscription_type} AND visits <= 0;
+    """
+
+def _fill_rollups(conn, source="attendance"):
+    """Recount all rollup tables from the attendance table (or an attendance_source)"""
+    for table in ROLLUP_TABLES:
+        conn.execute(f"DELETE FROM {table}")
+    conn.execute(f"""
+    INSERT INTO attendance_daily (date, visits)
+    SELECT date, COUNT(*) FROM {source}
+    WHERE date IS NOT NULL AND check_in_time IS NOT NULL
+    GROUP BY date
+    """)
+    conn.execute(f"""
+    INSERT INTO attendance_hourly (date, hour, visits)
+    SELECT date, CAST(strftime('%H', check_in_time) AS INTEGER) AS hour, COUNT(*) FROM {source}
+    WHERE date IS NOT NULL AND check_in_time IS NOT NULL
+    GROUP BY date, hour
+    """)
+    conn.execute(f"""
+    INSERT INTO attendance_by_type (date, subscription_type, visits)
+    SELECT a.date, c.subscription_type, COUNT(*) FROM {source} a
+    JOIN clients c ON a.client_id = c.id
+    WHERE a.date IS NOT NULL AND a.check_in_time IS NOT NULL
+    GROUP BY a.date, c.subscription_type
+    """)
+
+def _add_attendance_rollups(conn):
+    """Per-day, per-hour and per-subscription-type visit counts maintained by triggers"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS attendance_daily (
+        date TEXT PRIMARY KEY,
+        visits INTEGER NOT NULL
+    ) WITHOUT ROWID
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS attendance_hourly (
+        date TEXT NOT NULL,
+        hour INTEGER NOT NULL,
+        visits INTEGER NOT NULL,
+        PRIMARY KEY (date, hour)
+    ) WITHOUT ROWID
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS attendance_by_type (
+        date TEXT NOT NULL,
+        subscription_type TEXT NOT NULL,
+        visits INTEGER NOT NULL,
+        PRIMARY KEY (date, subscription_type)
+    ) WITHOUT ROWID
+    """)
+    
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS attendance_rollup_insert AFTER INSERT ON attendance BEGIN
+        {_rollup_add_sql("NEW")}
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS attendance_rollup_delete AFTER DELETE ON attendance BEGIN
+        {_rollup_remove_sql("OLD")}
+    END
+    """)
+    # Check-outs don't change the counts, so only the counted columns fire this
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS attendance_rollup_update
+    AFTER UPDATE OF client_id, check_in_time, date ON attendance BEGIN
+        {_rollup_remove_sql("OLD")}
+        {_rollup_add_sql("NEW")}
+    END
+    """)
+    
+    # Per-type counts follow the client's subscription type
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS clients_rollup_type
+    AFTER UPDATE OF subscription_type ON clients
+    WHEN OLD.subscription_type IS NOT NEW.subscription_type BEGIN
+        UPDATE attendance_by_type SET visits = visits - (
+            SELECT COUNT(*) FROM attendance
+            WHERE client_id = OLD.id AND date = attendance_by_type.date AND check_in_time IS NOT NULL
+        )
+        WHERE subscription_type = OLD.subscription_type
+        AND date IN (SELECT date FROM attendance WHERE client_id = OLD.id);
+        DELETE FROM attendance_by_type WHERE subscription_type = OLD.subscription_type AND visits <= 0;
+        INSERT INTO attendance_by_type (date, subscription_type, visits)
+        SELECT date, NEW.subscription_type, COUNT(*) FROM attendance
+        WHERE client_id = NEW.id AND date IS NOT NULL AND check_in_time IS NOT NULL
+        GROUP BY date
+        ON CONFLICT(date, subscription_type) DO UPDATE SET visits = visits + excluded.visits;
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS clients_rollup_delete AFTER DELETE ON clients BEGIN
+        UPDATE attendance_by_type SET visits = visits - (
+            SELECT COUNT(*) FROM attendance
+            WHERE client_id = OLD.id AND date = attendance_by_type.date AND check_in_time IS NOT NULL
+        )
+        WHERE subscription_type = OLD.subscription_type
+        AND date IN (SELECT date FROM attendance WHERE client_id = OLD.id);
+        DELETE FROM attendance_by_type WHERE subscription_type = OLD.subscription_type AND visits <= 0;
+    END
+    """)
+    
+    _fill_rollups(conn)
+
+def _add_open_visits_index(conn):
+    """Flag for visits closed without a check-out, and a partial index over open visits"""
+    conn.execute("ALTER TABLE attendance ADD COLUMN auto_closed INTEGER NOT NULL DEFAULT 0")
+    conn.execute("""
+    CREATE INDEX IF NOT EXISTS idx_attendance_open
+    ON attendance(check_in_time) WHERE check_out_time IS NULL AND auto_closed = 0
+    """)
+
+def _add_subscription_expiry(conn):
+    """Index for lapsed-subscription sweeps and a log of their results"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_clients_status_end ON clients(status, subscription_end)")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS expiry_sweeps (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        clients_expired INTEGER NOT NULL,
+        barcodes_deactivated INTEGER NOT NULL
+    )
+    """)
+
+def _add_attendance_archives(conn):
+    """Registry of attendance years moved to archive files"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS attendance_archives (
+        year INTEGER PRIMARY KEY,
+        file_name TEXT NOT NULL,
+        visits INTEGER NOT NULL,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+def _add_archive_client_totals(conn):
+    """Per-client visit totals of archived years, so summaries need no archive file"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS attendance_archive_totals (
+        client_id INTEGER NOT NULL,
+        year INTEGER NOT NULL,
+        visits INTEGER NOT NULL,
+        last_visit TIMESTAMP,
+        PRIMARY KEY (client_id, year)
+    ) WITHOUT ROWID
+    """)
+    
+    # ATTACH is not allowed inside the migration transaction; read each archive directly
+    for year, file_name in conn.execute("SELECT year, file_name FROM attendance_archives").fetchall():
+        path = archive_path(file_name)
+        if not os.path.exists(path):
+            print(f"Warning: attendance archive missing: {path}")
+            continue
+        archive = sqlite3.connect(path)
+        try:
+            totals = archive.execute("""
+            SELECT client_id, COUNT(*), MAX(check_in_time) FROM attendance GROUP BY client_id
+            """).fetchall()
         finally:
-            conn.close()
+            archive.close()
+        conn.executemany("""
+        INSERT OR REPLACE INTO attendance_archive_totals (client_id, year, visits, last_visit)
+        VALUES (?, ?, ?, ?)
+        """, [(client_id, year, visits, last_visit) for client_id, visits, last_visit in totals])
+
+# Ordered list of migrations; position + 1 is the schema version it produces.
+# Append new migrations at the end, never reorder or remove existing ones.
+MIGRATIONS = [
+    _add_query_indexes,
+    _add_client_search_index,
+    _add_client_trigrams,
+    _add_client_status_index,
+    _add_barcode_images,
+    _add_data_versions,
+    _add_attendance_client_time_index,
+    _add_attendance_rollups,
+    _add_open_visits_index,
+    _add_subscription_expiry,
+    _add_attendance_archives,
+    _add_archive_client_totals,
+]
+
+def get_schema_version():
+    """Get current schema version (PRAGMA user_version)"""
+    conn = get_connection()
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def run_migrations():
+    """Apply pending schema migrations and refresh planner statistics"""
+    applied = 0
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        with transaction(immediate=True) as conn:
+            # Re-check inside the write lock in case another process migrated
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                continue
+            migration(conn)
+            conn.execute(f"PRAGMA user_version={version}")
+        applied += 1
+        print(f"Applied migration {version}: {migration.__name__}")
+    
+    conn = get_connection()
+    if applied:
+        conn.execute("ANALYZE")
+    else:
+        conn.execute("PRAGMA optimize")
+    return applied
+
+# Most clients scored by one fuzzy search
+FUZZY_CANDIDATE_LIMIT = 500
+
+# Client columns returned to callers (search keys stay internal)
+CLIENT_COLUMNS = (
+    "id", "name", "phone", "email", "subscription_type",
+    "subscription_start", "subscription_end", "status", "created_at"
+)
+
+# Named client record; still unpacks like the positional row
+Client = namedtuple("Client", CLIENT_COLUMNS)
+
+def _client_columns(alias=""):
+    """Comma separated client column list, optionally table-qualified"""
+    prefix = f"{alias}." if alias else ""
+    return ", ".join(prefix + column for column in CLIENT_COLUMNS)
+
+def _client_cursor(conn):
+    """Cursor that returns Client records"""
+    cursor = conn.cursor()
+    cursor.row_factory = lambda _cursor, row: Client(*row)
+    return cursor
+
+def _index_trigrams(conn, client_id, name_search):
+    """Replace the trigram entries of a client"""
+    grams = trigrams(name_search)
+    conn.execute("DELETE FROM client_trigrams WHERE client_id=?", (client_id,))
+    conn.executemany(
+        "INSERT INTO client_trigrams (trigram, client_id) VALUES (?, ?)",
+        [(gram, client_id) for gram in grams]
+    )
+    conn.execute("UPDATE clients SET trigram_count=? WHERE id=?", (len(grams), client_id))
+
+def _load_all_clients(conn):
+    """Read the whole clients table (client cache loader)"""
+    cursor = _client_cursor(conn)
+    cursor.execute(f"SELECT {_client_columns()} FROM clients ORDER BY name, id")
+    return cursor.fetchall()
+
+def _load_client(conn, client_id):
+    """Read one client (client cache loader)"""
+    cursor = _client_cursor(conn)
+    cursor.execute(f"SELECT {_client_columns()} FROM clients WHERE id=?", (client_id,))
+    return cursor.fetchone()
 
 # Client CRUD operations
 class ClientDB:
     @staticmethod
     def add_client(name, phone, email, subscription_type, subscription_start, subscription_end):
         """Add new client"""
-        conn = get_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("""
-                INSERT INTO clients (name, phone, email, subscription_type, subscription_start, subscription_end)
-                VALUES (?, ?, ?, ?, ?, ?)
-                """, (name, phone, email, subscription_type, subscription_start, subscription_end))
-                conn.commit()
+        try:
+            with transaction() as conn:
+                cursor = conn.execute("""
+                INSERT INTO clients (name, phone, email, subscription_type, subscription_start, subscription_end,
+                                     name_search, phone_digits)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (name, phone, email, subscription_type, subscription_start, subscription_end,
+                      normalize_name(name), phone_digits(phone)))
                 client_id = cursor.lastrowid
-                return client_id
-            except Exception as e:
-                print(f"Error adding client: {e}")
-                return None
-            finally:
-                conn.close()
+                _index_trigrams(conn, client_id, normalize_name(name))
+            client_cache.invalidate()
+            return client_id
+        except Exception as e:
+            print(f"Error adding client: {e}")
+            return None
     
     @staticmethod
     def get_all_clients():
-        """Get all clients"""
-        conn = get_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("SELECT * FROM clients ORDER BY name")
-                clients = cursor.fetchall()
+        """Get all clients (served from the client cache)"""
+        try:
+            return client_cache.get_all(get_connection(), _load_all_clients)
+        except Exception as e:
+            print(f"Error fetching clients: {e}")
+            return []
+    
+    @staticmethod
+    def get_client(client_id):
+        """Get a single client by id"""
+        try:
+            return client_cache.get(get_connection(), client_id, _load_client)
+        except Exception as e:
+            print(f"Error fetching client: {e}")
+            return None
+    
+    @staticmethod
+    def get_clients_by_ids(client_ids):
+        """Get clients for a list of ids (mapping of id to client)"""
+        client_ids = list(dict.fromkeys(client_ids))
+        clients = {}
+        try:
+            cursor = _client_cursor(get_connection())
+            # Stay below SQLite's bound parameter limit
+            for start in range(0, len(client_ids), 500):
+                chunk = client_ids[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                cursor.execute(f"SELECT {_client_columns()} FROM clients WHERE id IN ({placeholders})", chunk)
+                for client in cursor.fetchall():
+                    clients[client.id] = client
+            return clients
+        except Exception as e:
+            print(f"Error fetching clients: {e}")
+            return {}
+    
+    @staticmethod
+    def get_clients(status=None, limit=None, after=None):
+        """Get clients ordered by name, optionally filtered by status.
+        
+        Pass the last client of the previous page as after to get the next page.
+        """
+        if limit is None and after is None:
+            # Whole listings come from the client cache
+            clients = ClientDB.get_all_clients()
+            if status is None:
                 return clients
-            except Exception as e:
-                print(f"Error fetching clients: {e}")
-                return []
-            finally:
-                conn.close()
+            return [client for client in clients if client.status == status]
+        
+        conditions = []
+        params = []
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if after is not None:
+            conditions.append("(name > ? OR (name = ? AND id > ?))")
+            params.extend([after.name, after.name, after.id])
+        
+        query = f"SELECT {_client_columns()} FROM clients"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY name, id"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        
+        try:
+            cursor = _client_cursor(get_connection())
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        except Exception as e:
+            print(f"Error fetching clients: {e}")
+            return []
+    
+    @staticmethod
+    def expiring_between(start, end, limit=None, after=None):
+        """Get active clients whose subscription ends between start and end (inclusive).
+        
+        Ordered by subscription_end, id; pass the last client of the previous
+        page as after to get the next page.
+        """
+        conditions = ["status = 'active'", "subscription_end BETWEEN ? AND ?"]
+        params = [start, end]
+        if after is not None:
+            conditions.append("(subscription_end, id) > (?, ?)")
+            params.extend([after.subscription_end, after.id])
+        
+        # Range scan of idx_clients_status_end, already in page order
+        query = f"""
+        SELECT {_client_columns()} FROM clients
+        WHERE {" AND ".join(conditions)}
+        ORDER BY subscription_end, id
+        """
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        
+        try:
+            cursor = _client_cursor(get_connection())
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        except Exception as e:
+            print(f"Error fetching expiring clients: {e}")
+            return []
+    
+    @staticmethod
+    def search(query, limit=50):
+        """Search clients by name, phone or email (prefix match, best first)"""
+        terms = normalize_name(query).split()
+        if not terms:
+            return []
+        
+        # Quote each term so FTS syntax characters are matched literally
+        match = " ".join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+        if is_phone_like(query):
+            # Phones are indexed as bare digits, so formatted input matches by digit prefix
+            match = '({}) OR phone_digits:"{}"*'.format(match, phone_digits(query))
+        try:
+            cursor = _client_cursor(get_connection())
+            cursor.execute(f"""
+            SELECT {_client_columns("c")} FROM clients_fts f
+            JOIN clients c ON c.id = f.rowid
+            WHERE clients_fts MATCH ?
+            ORDER BY f.rank
+            LIMIT ?
+            """, (match, limit))
+            return cursor.fetchall()
+        except sqlite3.OperationalError:
+            return ClientDB._search_prefix(" ".join(terms), limit)
+        except Exception as e:
+            print(f"Error searching clients: {e}")
+            return []
+    
+    @staticmethod
+    def _search_prefix(key, limit):
+        """Indexed prefix search on the normalized keys (used without FTS5)"""
+        try:
+            digits = phone_digits(key)
+            cursor = _client_cursor(get_connection())
+            cursor.execute(f"""
+            SELECT {_client_columns()} FROM clients
+            WHERE name_search >= ? AND name_search < ?
+            UNION
+            SELECT {_client_columns()} FROM clients
+            WHERE ? != '' AND phone_digits >= ? AND phone_digits < ?
+            ORDER BY name
+            LIMIT ?
+            """, (key, key + "\uffff", digits, digits, digits + "\uffff", limit))
+            return cursor.fetchall()
+        except Exception as e:
+            print(f"Error searching clients: {e}")
+            return []
+    
+    @staticmethod
+    def fuzzy_search(text, k=10, min_similarity=0.2):
+        """Get the k clients whose names are most similar to text (trigram similarity).
+        
+        Candidates come from the query's rarest trigrams, capped at
+        FUZZY_CANDIDATE_LIMIT clients, and are then scored on every trigram.
+        """
+        grams = trigrams(text)
+        if not grams:
+            return []
+        
+        try:
+            conn = get_connection()
+            # Leading "  x" trigrams only tell which letter a word starts with
+            lookup = [gram for gram in grams if not gram.startswith("  ")] or list(grams)
+            sizes = {}
+            for gram in lookup:
+                sizes[gram] = conn.execute("""
+                SELECT COUNT(*) FROM (SELECT 1 FROM client_trigrams WHERE trigram = ? LIMIT ?)
+                """, (gram, FUZZY_CANDIDATE_LIMIT)).fetchone()[0]
+            
+            # Rarest trigrams first, as many as fit under the cap
+            lookup.sort(key=sizes.get)
+            chosen, total = [], 0
+            for gram in lookup:
+                if chosen and total + sizes[gram] > FUZZY_CANDIDATE_LIMIT:
+                    break
+                chosen.append(gram)
+                total += sizes[gram]
+            
+            cursor = _client_cursor(conn)
+            cursor.execute(f"""
+            WITH candidates AS (
+                SELECT DISTINCT client_id FROM client_trigrams
+                WHERE trigram IN ({", ".join("?" * len(chosen))})
+                LIMIT ?
+            )
+            SELECT {_client_columns("c")} FROM (
+                SELECT t.client_id, COUNT(*) AS shared FROM candidates
+                JOIN client_trigrams t ON t.client_id = candidates.client_id
+                WHERE t.trigram IN ({", ".join("?" * len(grams))})
+                GROUP BY t.client_id
+            ) m
+            JOIN clients c ON c.id = m.client_id
+            WHERE CAST(m.shared AS REAL) / (? + c.trigram_count - m.shared) >= ?
+            ORDER BY CAST(m.shared AS REAL) / (? + c.trigram_count - m.shared) DESC, c.name
+            LIMIT ?
+            """, (*chosen, FUZZY_CANDIDATE_LIMIT, *grams, len(grams), min_similarity, len(grams), k))
+            return cursor.fetchall()
+        except Exception as e:
+            print(f"Error searching clients: {e}")
+            return []
     
     @staticmethod
     def update_client(client_id, name, phone, email, subscription_type, subscription_start, subscription_end, status):
-        """Update client information"""
-        conn = get_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("""
+        """Update client information.
+        
+        Moving subscription_end of an expired client to today or later renews
+        it: the client and the barcodes lapsed by expire_lapsed become active.
+        """
+        renewed = bool(subscription_end) and subscription_end >= datetime.now().strftime('%Y-%m-%d')
+        if renewed and status == 'expired':
+            status = 'active'
+        try:
+            with transaction() as conn:
+                conn.execute("""
                 UPDATE clients 
                 SET name=?, phone=?, email=?, subscription_type=?, 
-                    subscription_start=?, subscription_end=?, status=?
+                    subscription_start=?, subscription_end=?, status=?,
+                    name_search=?, phone_digits=?
                 WHERE id=?
-                """, (name, phone, email, subscription_type, subscription_start, subscription_end, status, client_id))
-                conn.commit()
-                return True
-            except Exception as e:
-                print(f"Error updating client: {e}")
-                return False
-            finally:
-                conn.close()
+                """, (name, phone, email, subscription_type, subscription_start, subscription_end, status,
+                      normalize_name(name), phone_digits(phone), client_id))
+                _index_trigrams(conn, client_id, normalize_name(name))
+                
+                barcode_ids = []
+                if renewed and status == 'active':
+                    barcode_ids = [row[0] for row in conn.execute(
+                        "SELECT id FROM barcodes WHERE client_id = ? AND status = 'lapsed'", (client_id,)
+                    )]
+                    conn.execute("""
+                    UPDATE barcodes SET status = 'active', updated_at = CURRENT_TIMESTAMP
+                    WHERE client_id = ? AND status = 'lapsed'
+                    """, (client_id,))
+            client_cache.invalidate()
+            barcode_index.update_client(client_id, name, subscription_end)
+            for barcode_id in barcode_ids:
+                barcode_index.set_status(barcode_id, 'active')
+            return True
+        except Exception as e:
+            print(f"Error updating client: {e}")
+            return False
+    
+    @staticmethod
+    def expire_lapsed(today=None):
+        """Mark active clients whose subscription ended before today as expired.
+        
+        Their active barcodes are set to 'lapsed' in the same transaction (so
+        update_client can reactivate them on renewal) and the counts are logged
+        in expiry_sweeps. Returns a SweepResult, or None on error.
+        """
+        today = today or datetime.now().strftime('%Y-%m-%d')
+        lapsed = "SELECT id FROM clients WHERE status = 'active' AND subscription_end < ?"
+        try:
+            with transaction(immediate=True) as conn:
+                barcode_ids = [row[0] for row in conn.execute(f"""
+                SELECT id FROM barcodes WHERE status = 'active' AND client_id IN ({lapsed})
+                """, (today,))]
+                conn.execute(f"""
+                UPDATE barcodes SET status = 'lapsed', updated_at = CURRENT_TIMESTAMP
+                WHERE status = 'active' AND client_id IN ({lapsed})
+                """, (today,))
+                cursor = conn.execute(
+                    "UPDATE clients SET status = 'expired' WHERE status = 'active' AND subscription_end < ?",
+                    (today,)
+                )
+                result = SweepResult(cursor.rowcount, len(barcode_ids))
+                conn.execute("""
+                INSERT INTO expiry_sweeps (clients_expired, barcodes_deactivated) VALUES (?, ?)
+                """, result)
+            
+            if result.clients_expired:
+                client_cache.invalidate()
+            for barcode_id in barcode_ids:
+                barcode_index.set_status(barcode_id, 'lapsed')
+            return result
+        except Exception as e:
+            print(f"Error expiring subscriptions: {e}")
+            return None
     
     @staticmethod
     def delete_client(client_id):
         """Delete client"""
-        conn = get_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM clients WHERE id=?", (client_id,))
-                conn.commit()
-                return True
-            except Exception as e:
-                print(f"Error deleting client: {e}")
-                return False
-            finally:
-                conn.close()
+        try:
+            with transaction() as conn:
+                conn.execute("DELETE FROM client_trigrams WHERE client_id=?", (client_id,))
+                conn.execute("DELETE FROM clients WHERE id=?", (client_id,))
+            client_cache.invalidate()
+            barcode_index.remove_client(client_id)
+            return True
+        except Exception as e:
+            print(f"Error deleting client: {e}")
+            return False
+
+# Attendance archive: closed years are moved to backups/attendance_<year>.db
+# next to the live database. A year is registered in attendance_archives in
+# the same transaction that deletes it from the live table, so every visit is
+# read from exactly one place. The rollup tables keep their archived days.
+ARCHIVE_DIR_NAME = "backups"
+ATTENDANCE_COLUMNS = "id, client_id, check_in_time, check_out_time, date, status"
+
+def archive_path(file_name):
+    """Full path of an archive file"""
+    return os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), ARCHIVE_DIR_NAME, file_name)
+
+@contextmanager
+def attendance_source(conn, start=None, end=None):
+    """Yield a FROM source over live attendance plus the archives overlapping start..end.
+    
+    start and end are YYYY-MM-DD dates (None for open ends). Archive files
+    are attached for the duration of the block, which must not be inside a
+    transaction. Without archived years in range the source is the live table.
+    """
+    rows = conn.execute("""
+    SELECT year, file_name FROM attendance_archives
+    WHERE year BETWEEN ? AND ?
+    ORDER BY year
+    """, (int(start[:4]) if start else 0, int(end[:4]) if end else 9999)).fetchall()
+    
+    schemas = []
+    try:
+        for year, file_name in rows:
+            path = archive_path(file_name)
+            if not os.path.exists(path):
+                # Never let ATTACH create an empty file in its place
+                print(f"Warning: attendance archive missing: {path}")
+                continue
+            schema = f"archive_{year}"
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+            schemas.append(schema)
+        
+        if schemas:
+            parts = [f"SELECT {ATTENDANCE_COLUMNS} FROM main.attendance"]
+            parts += [f"SELECT {ATTENDANCE_COLUMNS} FROM {schema}.attendance" for schema in schemas]
+            yield "(" + " UNION ALL ".join(parts) + ")"
+        else:
+            yield "attendance"
+    finally:
+        for schema in schemas:
+            conn.execute(f"DETACH DATABASE {schema}")
+
+# Result of one subscription expiry sweep
+SweepResult = namedtuple("SweepResult", ["clients_expired", "barcodes_deactivated"])
+
+# Visit summary of one client
+AttendanceSummary = namedtuple("AttendanceSummary", ["total_visits", "last_visit", "visits_this_month"])
+
+# Visit statistics of one day, read from the rollup tables
+DayStats = namedtuple("DayStats", ["visits", "visits_this_month", "peak_hour", "peak_visits", "by_type"])
 
 # Attendance operations
 class AttendanceDB:
+    # Check-in policies
+    POLICY_NONE = 'none'  # Repeat check-ins are allowed
+    POLICY_ONE_PER_DAY = 'one_per_day'  # One check-in per client and date
+    POLICY_ANTI_PASSBACK = 'anti_passback'  # No repeat within passback_minutes
+    
+    policy = POLICY_NONE
+    passback_minutes = 30
+    
+    # Results of mark_attendance
+    MARKED = 'marked'
+    REJECTED = 'rejected'  # Refused by the check-in policy
+    FAILED = 'failed'
+    
+    # Check-out: scanning a client with an open visit checks them out, unless
+    # the visit is younger than min_visit_minutes (a double scan). Visits still
+    # open after auto_checkout_hours are closed by auto_check_out(), which
+    # flags them auto_closed and leaves the unknown check-out time NULL.
+    checkout_on_scan = True
+    min_visit_minutes = 5
+    auto_checkout_hours = 4
+    
+    @staticmethod
+    def set_policy(policy, passback_minutes=None):
+        """Choose the check-in policy enforced by insert_attendance"""
+        if policy not in (AttendanceDB.POLICY_NONE, AttendanceDB.POLICY_ONE_PER_DAY,
+                          AttendanceDB.POLICY_ANTI_PASSBACK):
+            raise ValueError(f"Unknown check-in policy: {policy}")
+        AttendanceDB.policy = policy
+        if passback_minutes is not None:
+            AttendanceDB.passback_minutes = passback_minutes
+    
+    @staticmethod
+    def insert_attendance(conn, client_id, status='present'):
+        """Insert an attendance row on an open transaction and return its id.
+        
+        Returns None when the check-in policy rejects the row. The policy is
+        checked by the INSERT statement itself, so concurrent check-ins
+        cannot both pass it.
+        """
+        now = datetime.now()
+        today = now.strftime('%Y-%m-%d')
+        row = (client_id, now.strftime('%Y-%m-%d %H:%M:%S'), today, status)
+        open_visit = AttendanceDB.find_open_visit(conn, client_id)
+        
+        if AttendanceDB.policy == AttendanceDB.POLICY_NONE:
+            cursor = conn.execute("""
+            INSERT INTO attendance (client_id, check_in_time, date, status)
+            VALUES (?, ?, ?, ?)
+            """, row)
+        else:
+            if AttendanceDB.policy == AttendanceDB.POLICY_ONE_PER_DAY:
+                since = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            else:
+                since = now - timedelta(minutes=AttendanceDB.passback_minutes)
+            
+            # Range on (client_id, date) uses idx_attendance_client_date
+            cursor = conn.execute("""
+            INSERT INTO attendance (client_id, check_in_time, date, status)
+            SELECT ?, ?, ?, ?
+            WHERE NOT EXISTS (
+                SELECT 1 FROM attendance
+                WHERE client_id = ? AND date >= ? AND check_in_time >= ?
+            )
+            """, (*row, client_id, since.strftime('%Y-%m-%d'), since.strftime('%Y-%m-%d %H:%M:%S')))
+            if cursor.rowcount == 0:
+                return None
+        attendance_id = cursor.lastrowid
+        
+        # A client is in the gym once: an earlier open visit ends without a check-out time
+        if open_visit is not None:
+            conn.execute("UPDATE attendance SET auto_closed = 1 WHERE id = ?", (open_visit[0],))
+        
+        def remember():
+            today_checkins.add(client_id, today)
+            occupancy.check_in(attendance_id, client_id, row[1])
+        after_commit(remember)
+        return attendance_id
+    
+    @staticmethod
+    def find_open_visit(conn, client_id):
+        """Get (id, check_in_time) of the client's latest visit that is not checked out"""
+        cutoff = datetime.now() - timedelta(hours=AttendanceDB.auto_checkout_hours)
+        return conn.execute("""
+        SELECT id, check_in_time FROM attendance
+        WHERE client_id = ? AND check_in_time >= ? AND check_out_time IS NULL AND auto_closed = 0
+        ORDER BY check_in_time DESC
+        LIMIT 1
+        """, (client_id, cutoff.strftime('%Y-%m-%d %H:%M:%S'))).fetchone()
+    
+    @staticmethod
+    def close_visit(conn, attendance_id):
+        """Set the check-out time of a visit on an open transaction"""
+        conn.execute("""
+        UPDATE attendance SET check_out_time = ?
+        WHERE id = ? AND check_out_time IS NULL AND auto_closed = 0
+        """, (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), attendance_id))
+        after_commit(lambda: occupancy.check_out(attendance_id))
+    
+    @staticmethod
+    def check_out(client_id):
+        """Check a client out of their open visit; returns whether one was open"""
+        try:
+            with transaction(immediate=True) as conn:
+                visit = AttendanceDB.find_open_visit(conn, client_id)
+                if visit is None:
+                    return False
+                AttendanceDB.close_visit(conn, visit[0])
+            return True
+        except Exception as e:
+            print(f"Error checking out: {e}")
+            return False
+    
+    @staticmethod
+    def auto_check_out():
+        """Close visits open longer than auto_checkout_hours; returns how many were closed.
+        
+        The check-out time is unknown, so it stays NULL and the visit is
+        flagged auto_closed instead.
+        """
+        hours = AttendanceDB.auto_checkout_hours
+        cutoff = (datetime.now() - timedelta(hours=hours)).strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            with transaction() as conn:
+                cursor = conn.execute("""
+                UPDATE attendance SET auto_closed = 1
+                WHERE check_out_time IS NULL AND auto_closed = 0 AND check_in_time < ?
+                """, (cutoff,))
+            occupancy.expire(cutoff)
+            return cursor.rowcount
+        except Exception as e:
+            print(f"Error closing open visits: {e}")
+            return 0
+    
+    @staticmethod
+    def load_occupancy():
+        """Close stale visits and load the open ones into the occupancy tracker"""
+        AttendanceDB.auto_check_out()
+        try:
+            conn = get_connection()
+            cursor = conn.execute("""
+            SELECT id, client_id, check_in_time FROM attendance
+            WHERE check_out_time IS NULL AND auto_closed = 0 AND check_in_time IS NOT NULL
+            """)
+            occupancy.load(cursor.fetchall())
+            return len(occupancy)
+        except Exception as e:
+            print(f"Error loading occupancy: {e}")
+            return None
+    
+    @staticmethod
+    def has_attendance_on(client_id, date):
+        """Check whether a client has an attendance row on a date (YYYY-MM-DD)"""
+        if today_checkins.contains(client_id, date):
+            return True
+        try:
+            conn = get_connection()
+            row = conn.execute(
+                "SELECT 1 FROM attendance WHERE client_id = ? AND date = ? LIMIT 1",
+                (client_id, date)
+            ).fetchone()
+            if row:
+                today_checkins.add(client_id, date)
+            return row is not None
+        except Exception as e:
+            print(f"Error checking attendance: {e}")
+            return False
+    
     @staticmethod
     def mark_attendance(client_id, status='present'):
-        """Mark client attendance"""
-        conn = get_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                today = datetime.now().strftime('%Y-%m-%d')
-                check_in_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                
-                cursor.execute("""
-                INSERT INTO attendance (client_id, check_in_time, date, status)
-                VALUES (?, ?, ?, ?)
-                """, (client_id, check_in_time, today, status))
-                conn.commit()
-                return True
-            except Exception as e:
-                print(f"Error marking attendance: {e}")
-                return False
-            finally:
-                conn.close()
+        """Mark client attendance; returns MARKED, REJECTED or FAILED"""
+        try:
+            with transaction() as conn:
+                attendance_id = AttendanceDB.insert_attendance(conn, client_id, status)
+            return AttendanceDB.MARKED if attendance_id is not None else AttendanceDB.REJECTED
+        except Exception as e:
+            print(f"Error marking attendance: {e}")
+            return AttendanceDB.FAILED
     
     @staticmethod
-    def get_attendance_by_client(client_id):
-        """Get attendance history for a client"""
-        conn = get_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("""
-                SELECT a.*, c.name FROM attendance a
+    def get_attendance_by_client(client_id, limit=None, before=None, before_id=None):
+        """Get attendance history for a client, newest first.
+        
+        Pass the check_in_time (and id) of the last row of the previous page
+        as before (and before_id) to get the next page.
+        """
+        conditions = ["a.client_id = ?"]
+        params = [client_id]
+        if before is not None:
+            if before_id is not None:
+                conditions.append("(a.check_in_time, a.id) < (?, ?)")
+                params.extend([before, before_id])
+            else:
+                conditions.append("a.check_in_time < ?")
+                params.append(before)
+        
+        columns = ", ".join(f"a.{column}" for column in ATTENDANCE_COLUMNS.split(", "))
+        # CROSS JOIN keeps attendance as the outer loop so pages are read
+        # straight from idx_attendance_client_time without sorting
+        query = f"""
+        SELECT {columns}, c.name FROM {{source}} a
+        CROSS JOIN clients c ON a.client_id = c.id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY a.check_in_time DESC, a.id DESC
+        """
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        
+        try:
+            conn = get_connection()
+            # Archived years are older than the live rows, so the live table
+            # alone answers unless the page runs short or reaches an archived year
+            attendance = conn.execute(query.format(source="attendance"), params).fetchall()
+            archived = conn.execute(
+                "SELECT MAX(year) FROM attendance_archives WHERE year <= ?",
+                (int(before[:4]) if before else 9999,)
+            ).fetchone()[0]
+            if archived is None:
+                return attendance
+            if limit is not None and len(attendance) == limit:
+                oldest = attendance[-1][2]
+                if oldest and int(oldest[:4]) > archived:
+                    return attendance
+            
+            with attendance_source(conn, end=before[:10] if before else None) as source:
+                return conn.execute(query.format(source=source), params).fetchall()
+        except Exception as e:
+            print(f"Error fetching attendance: {e}")
+            return []
+    
+    @staticmethod
+    def get_client_summary(client_id):
+        """Get total visits, last visit and visits this month of a client.
+        
+        Archived years count through attendance_archive_totals, so no archive
+        file is attached (the current month is never archived).
+        """
+        month_start = datetime.now().strftime('%Y-%m-01 00:00:00')
+        try:
+            conn = get_connection()
+            row = conn.execute("""
+            SELECT live.visits + archived.visits,
+                   COALESCE(MAX(live.last_visit, archived.last_visit), live.last_visit, archived.last_visit),
+                   live.this_month
+            FROM (
+                SELECT COUNT(*) AS visits, MAX(check_in_time) AS last_visit,
+                       COUNT(CASE WHEN check_in_time >= ? THEN 1 END) AS this_month
+                FROM attendance WHERE client_id = ?
+            ) live, (
+                SELECT COALESCE(SUM(visits), 0) AS visits, MAX(last_visit) AS last_visit
+                FROM attendance_archive_totals WHERE client_id = ?
+            ) archived
+            """, (month_start, client_id, client_id)).fetchone()
+            return AttendanceSummary(*row)
+        except Exception as e:
+            print(f"Error fetching attendance summary: {e}")
+            return None
+    
+    @staticmethod
+    def get_attendance_by_date(date_filter):
+        """Get attendance records for a specific date"""
+        try:
+            conn = get_connection()
+            with attendance_source(conn, date_filter, date_filter) as source:
+                cursor = conn.execute(f"""
+                SELECT a.id, c.name, a.check_in_time, a.check_out_time, a.date, a.status
+                FROM {source} a
                 JOIN clients c ON a.client_id = c.id
-                WHERE a.client_id = ?
+                WHERE a.date = ?
                 ORDER BY a.check_in_time DESC
-                """, (client_id,))
-                attendance = cursor.fetchall()
-                return attendance
-            except Exception as e:
-                print(f"Error fetching attendance: {e}")
-                return []
+                """, (date_filter,))
+                return cursor.fetchall()
+        except Exception as e:
+            print(f"Error loading attendance data: {e}")
+            return []
+    
+    @staticmethod
+    def rebuild_rollups():
+        """Recount the attendance rollup tables from scratch (archived years included)"""
+        try:
+            conn = get_connection()
+            with attendance_source(conn) as source:
+                with transaction(immediate=True):
+                    _fill_rollups(conn, source)
+            return True
+        except Exception as e:
+            print(f"Error rebuilding attendance rollups: {e}")
+            return False
+    
+    @staticmethod
+    def archive_year(year):
+        """Move a closed year of attendance to its archive file; returns the rows moved.
+        
+        The rows are copied and committed to the archive first, then deleted
+        from the live table, so an interrupted run is simply repeated.
+        """
+        if year >= datetime.now().year:
+            print(f"Error archiving attendance: {year} is not a closed year")
+            return None
+        
+        file_name = f"attendance_{year}.db"
+        path = archive_path(file_name)
+        start, end = f"{year}-01-01", f"{year}-12-31"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            conn = get_connection()
+            conn.execute("ATTACH DATABASE ? AS archive_new", (path,))
+            try:
+                with transaction(immediate=True):
+                    conn.execute("""
+                    CREATE TABLE IF NOT EXISTS archive_new.attendance (
+                        id INTEGER PRIMARY KEY,
+                        client_id INTEGER,
+                        check_in_time TIMESTAMP,
+                        check_out_time TIMESTAMP,
+                        date TEXT,
+                        status TEXT DEFAULT 'present'
+                    )
+                    """)
+                    conn.execute("""
+                    CREATE INDEX IF NOT EXISTS archive_new.idx_attendance_date
+                    ON attendance(date, check_in_time)
+                    """)
+                    conn.execute("""
+                    CREATE INDEX IF NOT EXISTS archive_new.idx_attendance_client_time
+                    ON attendance(client_id, check_in_time)
+                    """)
+                    conn.execute(f"""
+                    INSERT OR REPLACE INTO archive_new.attendance ({ATTENDANCE_COLUMNS})
+                    SELECT {ATTENDANCE_COLUMNS} FROM main.attendance WHERE date BETWEEN ? AND ?
+                    """, (start, end))
+                
+                with transaction(immediate=True):
+                    missing = conn.execute("""
+                    SELECT COUNT(*) FROM main.attendance m
+                    WHERE m.date BETWEEN ? AND ?
+                    AND NOT EXISTS (SELECT 1 FROM archive_new.attendance x WHERE x.id = m.id)
+                    """, (start, end)).fetchone()[0]
+                    if missing:
+                        raise sqlite3.DatabaseError(f"{missing} rows were not copied to {path}")
+                    
+                    # Deleting fires the rollup triggers; archived days keep their counts
+                    saved = {table: conn.execute(f"SELECT * FROM {table} WHERE date BETWEEN ? AND ?",
+                                                 (start, end)).fetchall()
+                             for table in ROLLUP_TABLES}
+                    moved = conn.execute("DELETE FROM main.attendance WHERE date BETWEEN ? AND ?",
+                                         (start, end)).rowcount
+                    for table, rows in saved.items():
+                        if rows:
+                            placeholders = ", ".join("?" * len(rows[0]))
+                            conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({placeholders})", rows)
+                    
+                    conn.execute("""
+                    INSERT INTO attendance_archives (year, file_name, visits)
+                    VALUES (?, ?, (SELECT COUNT(*) FROM archive_new.attendance))
+                    ON CONFLICT(year) DO UPDATE SET visits = excluded.visits, archived_at = CURRENT_TIMESTAMP
+                    """, (year, file_name))
+                    conn.execute("DELETE FROM attendance_archive_totals WHERE year = ?", (year,))
+                    conn.execute("""
+                    INSERT INTO attendance_archive_totals (client_id, year, visits, last_visit)
+                    SELECT client_id, ?, COUNT(*), MAX(check_in_time) FROM archive_new.attendance
+                    GROUP BY client_id
+                    """, (year,))
             finally:
-                conn.close()
+                conn.execute("DETACH DATABASE archive_new")
+            return moved
+        except Exception as e:
+            print(f"Error archiving attendance: {e}")
+            return None
+    
+    @staticmethod
+    def archive_closed_years():
+        """Archive every year before the current one; returns {year: rows moved}"""
+        try:
+            conn = get_connection()
+            years = [int(row[0]) for row in conn.execute("""
+            SELECT DISTINCT substr(date, 1, 4) FROM attendance
+            WHERE date < ?
+            """, (f"{datetime.now().year}-01-01",))]
+        except Exception as e:
+            print(f"Error listing attendance years: {e}")
+            return {}
+        return {year: AttendanceDB.archive_year(year) for year in years}
+    
+    @staticmethod
+    def get_daily_counts(start, end):
+        """Get (date, visits) for days with visits between start and end (YYYY-MM-DD, inclusive)"""
+        try:
+            conn = get_connection()
+            cursor = conn.execute("""
+            SELECT date, visits FROM attendance_daily
+            WHERE date BETWEEN ? AND ?
+            ORDER BY date
+            """, (start, end))
+            return cursor.fetchall()
+        except Exception as e:
+            print(f"Error loading daily attendance: {e}")
+            return []
+    
+    @staticmethod
+    def get_hourly_counts(start, end):
+        """Get (hour, visits) summed over the days between start and end"""
+        try:
+            conn = get_connection()
+            cursor = conn.execute("""
+            SELECT hour, SUM(visits) FROM attendance_hourly
+            WHERE date BETWEEN ? AND ?
+            GROUP BY hour
+            ORDER BY hour
+            """, (start, end))
+            return cursor.fetchall()
+        except Exception as e:
+            print(f"Error loading hourly attendance: {e}")
+            return []
+    
+    @staticmethod
+    def get_type_counts(start, end):
+        """Get (subscription_type, visits) summed over the days between start and end"""
+        try:
+            conn = get_connection()
+            cursor = conn.execute("""
+            SELECT subscription_type, SUM(visits) AS total FROM attendance_by_type
+            WHERE date BETWEEN ? AND ?
+            GROUP BY subscription_type
+            ORDER BY total DESC, subscription_type
+            """, (start, end))
+            return cursor.fetchall()
+        except Exception as e:
+            print(f"Error loading attendance by subscription type: {e}")
+            return []
+    
+    @staticmethod
+    def get_day_stats(day):
+        """Get the visit statistics of a day (YYYY-MM-DD) from the rollups"""
+        try:
+            conn = get_connection()
+            row = conn.execute("SELECT visits FROM attendance_daily WHERE date = ?", (day,)).fetchone()
+            month = conn.execute("""
+            SELECT COALESCE(SUM(visits), 0) FROM attendance_daily
+            WHERE date BETWEEN ? AND ?
+            """, (day[:8] + "01", day)).fetchone()
+            peak = conn.execute("""
+            SELECT hour, visits FROM attendance_hourly
+            WHERE date = ?
+            ORDER BY visits DESC, hour
+            LIMIT 1
+            """, (day,)).fetchone()
+            by_type = AttendanceDB.get_type_counts(day, day)
+            return DayStats(
+                row[0] if row else 0,
+                month[0],
+                peak[0] if peak else None,
+                peak[1] if peak else 0,
+                by_type
+            )
+        except Exception as e:
+            print(f"Error loading attendance statistics: {e}")
+            return None
 
 # Barcode operations
 class BarcodeDB:
     @staticmethod
     def create_barcode(client_id, barcode_data):
         """Create barcode for client"""
-        conn = get_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("""
+        try:
+            with transaction() as conn:
+                cursor = conn.execute("""
                 INSERT INTO barcodes (client_id, barcode_data)
                 VALUES (?, ?)
                 """, (client_id, barcode_data))
-                conn.commit()
-                return True
-            except Exception as e:
-                print(f"Error creating barcode: {e}")
-                return False
-            finally:
-                conn.close()
+                barcode_id = cursor.lastrowid
+                
+                # Read whether or not the index is loaded yet: it may load on the
+                # db worker meanwhile, and put() ignores entries until it has
+                client = conn.execute(
+                    "SELECT name, subscription_end FROM clients WHERE id=?", (client_id,)
+                ).fetchone()
+            
+            if client:
+                barcode_index.put(barcode_data, BarcodeEntry(
+                    barcode_id, client_id, 'active', client[1], client[0]
+                ))
+            return True
+        except Exception as e:
+            print(f"Error creating barcode: {e}")
+            return False
+    
+    @staticmethod
+    def create_barcodes(barcodes):
+        """Create many barcodes in one transaction from (client_id, barcode_data) pairs"""
+        barcodes = list(barcodes)
+        if not barcodes:
+            return True
+        try:
+            with transaction() as conn:
+                conn.executemany("""
+                INSERT INTO barcodes (client_id, barcode_data)
+                VALUES (?, ?)
+                """, barcodes)
+                
+                # Read whether or not the index is loaded yet (see create_barcode),
+                # staying below SQLite's bound parameter limit
+                rows = []
+                for start in range(0, len(barcodes), 500):
+                    chunk = [barcode_data for _, barcode_data in barcodes[start:start + 500]]
+                    placeholders = ", ".join("?" * len(chunk))
+                    rows += conn.execute(f"""
+                    SELECT b.barcode_data, b.id, b.client_id, b.status, c.subscription_end, c.name
+                    FROM barcodes b
+                    JOIN clients c ON c.id = b.client_id
+                    WHERE b.barcode_data IN ({placeholders})
+                    """, chunk).fetchall()
+            
+            for barcode_data, *fields in rows:
+                barcode_index.put(barcode_data, BarcodeEntry(*fields))
+            return True
+        except Exception as e:
+            print(f"Error creating barcodes: {e}")
+            return False
+    
+    @staticmethod
+    def renew_barcode(client_id, barcode_data):
+        """Replace a client's card: expire its active and lapsed barcodes and add a new one.
+        
+        Both happen in one transaction, so the client never ends up with two
+        active cards or none.
+        """
+        try:
+            with transaction(immediate=True) as conn:
+                expired_ids = [row[0] for row in conn.execute("""
+                SELECT id FROM barcodes WHERE client_id = ? AND status IN ('active', 'lapsed')
+                """, (client_id,))]
+                conn.execute("""
+                UPDATE barcodes SET status = 'expired', updated_at = CURRENT_TIMESTAMP
+                WHERE client_id = ? AND status IN ('active', 'lapsed')
+                """, (client_id,))
+                barcode_id = conn.execute("""
+                INSERT INTO barcodes (client_id, barcode_data)
+                VALUES (?, ?)
+                """, (client_id, barcode_data)).lastrowid
+                client = conn.execute(
+                    "SELECT name, subscription_end FROM clients WHERE id=?", (client_id,)
+                ).fetchone()
+            
+            for expired_id in expired_ids:
+                barcode_index.set_status(expired_id, 'expired')
+            if client:
+                barcode_index.put(barcode_data, BarcodeEntry(
+                    barcode_id, client_id, 'active', client[1], client[0]
+                ))
+            return True
+        except Exception as e:
+            print(f"Error renewing barcode: {e}")
+            return False
+    
+    @staticmethod
+    def get_clients_without_barcode(status='active'):
+        """Get ids of clients with the given status and no active barcode"""
+        try:
+            conn = get_connection()
+            cursor = conn.execute("""
+            SELECT c.id FROM clients c
+            WHERE c.status = ?
+              AND NOT EXISTS (
+                  SELECT 1 FROM barcodes b
+                  WHERE b.client_id = c.id AND b.status = 'active'
+              )
+            ORDER BY c.id
+            """, (status,))
+            return [row[0] for row in cursor.fetchall()]
+        except Exception as e:
+            print(f"Error fetching clients without barcode: {e}")
+            return []
     
     @staticmethod
     def update_barcode_status(barcode_id, status):
         """Update barcode status (active/inactive)"""
-        conn = get_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("""
+        try:
+            with transaction() as conn:
+                conn.execute("""
                 UPDATE barcodes SET status=?, updated_at=CURRENT_TIMESTAMP
                 WHERE id=?
                 """, (status, barcode_id))
-                conn.commit()
-                return True
-            except Exception as e:
-                print(f"Error updating barcode status: {e}")
-                return False
-            finally:
-                conn.close()
+            barcode_index.set_status(barcode_id, status)
+            return True
+        except Exception as e:
+            print(f"Error updating barcode status: {e}")
+            return False
     
     @staticmethod
     def get_client_barcode(client_id):
-        """Get barcode for client"""
-        conn = get_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("""
-                SELECT b.*, c.name FROM barcodes b
+        """Get the current barcode for client (newest active one first)"""
+        try:
+            conn = get_connection()
+            cursor = conn.execute("""
+            SELECT b.*, c.name FROM barcodes b
+            JOIN clients c ON b.client_id = c.id
+            WHERE b.client_id = ?
+            ORDER BY b.status = 'active' DESC, b.id DESC
+            LIMIT 1
+            """, (client_id,))
+            barcode = cursor.fetchone()
+            return barcode
+        except Exception as e:
+            print(f"Error fetching barcode: {e}")
+            return None
+    
+    @staticmethod
+    def iter_card_rows(barcode_ids=None, status='active', batch_size=500):
+        """Yield (barcode_data, client name, subscription_end) for card printing.
+        
+        Rows are streamed in batches so large print runs keep memory bounded.
+        """
+        try:
+            conn = get_connection()
+            if barcode_ids is None:
+                cursor = conn.execute("""
+                SELECT b.barcode_data, c.name, c.subscription_end
+                FROM barcodes b
                 JOIN clients c ON b.client_id = c.id
-                WHERE b.client_id = ?
-                """, (client_id,))
-                barcode = cursor.fetchone()
-                return barcode
-            except Exception as e:
-                print(f"Error fetching barcode: {e}")
-                return None
-            finally:
-                conn.close()
+                WHERE b.status = ?
+                ORDER BY c.name, c.id
+                """, (status,))
+            else:
+                # Stay below SQLite's bound parameter limit: one ordered cursor
+                # per chunk of ids, merged back into a single ordered stream
+                barcode_ids = list(dict.fromkeys(barcode_ids))
+                cursors = []
+                for start in range(0, len(barcode_ids), 500):
+                    chunk = barcode_ids[start:start + 500]
+                    placeholders = ", ".join("?" * len(chunk))
+                    cursors.append(conn.execute(f"""
+                    SELECT c.name, c.id, b.barcode_data, c.subscription_end
+                    FROM barcodes b
+                    JOIN clients c ON b.client_id = c.id
+                    WHERE b.id IN ({placeholders})
+                    ORDER BY c.name, c.id
+                    """, chunk))
+                for name, _, barcode_data, subscription_end in heapq.merge(*cursors, key=lambda row: row[:2]):
+                    yield barcode_data, name, subscription_end
+                return
+            
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield from rows
+        except Exception as e:
+            print(f"Error fetching card data: {e}")
+    
+    @staticmethod
+    def get_all_barcodes():
+        """Get all barcodes with client names"""
+        try:
+            conn = get_connection()
+            cursor = conn.execute("""
+            SELECT b.id, c.name, b.barcode_data, b.status, b.created_at, b.updated_at
+            FROM barcodes b
+            JOIN clients c ON b.client_id = c.id
+            ORDER BY b.created_at DESC
+            """)
+            return cursor.fetchall()
+        except Exception as e:
+            print(f"Error loading barcode data: {e}")
+            return []
+
+class BarcodeImageDB:
+    # Barcode statuses whose images are no longer needed
+    STALE_STATUSES = ('expired', 'renewed')
+    
+    @staticmethod
+    def record_images(images):
+        """Record stored images as (barcode_data, digest, size) rows"""
+        if not images:
+            return True
+        try:
+            with transaction() as conn:
+                conn.executemany("""
+                INSERT OR REPLACE INTO barcode_images (barcode_data, digest, size)
+                VALUES (?, ?, ?)
+                """, images)
+            return True
+        except Exception as e:
+            print(f"Error recording barcode images: {e}")
+            return False
+    
+    @staticmethod
+    def get_stale_images(limit=500):
+        """Get (barcode_data, digest) of images whose barcode expired, was renewed or is gone.
+        
+        Images without a barcode row get a day of grace, since bulk jobs
+        write images before inserting their barcodes.
+        """
+        try:
+            conn = get_connection()
+            cursor = conn.execute("""
+            SELECT i.barcode_data, i.digest
+            FROM barcode_images i
+            LEFT JOIN barcodes b ON b.barcode_data = i.barcode_data
+            WHERE b.status IN (?, ?)
+               OR (b.id IS NULL AND i.created_at < datetime('now', '-1 day'))
+            LIMIT ?
+            """, (*BarcodeImageDB.STALE_STATUSES, limit))
+            return cursor.fetchall()
+        except Exception as e:
+            print(f"Error fetching stale barcode images: {e}")
+            return []
+    
+    @staticmethod
+    def delete_images(barcode_datas):
+        """Forget images that were removed from the store"""
+        try:
+            with transaction() as conn:
+                conn.executemany("DELETE FROM barcode_images WHERE barcode_data = ?",
+                                 [(barcode_data,) for barcode_data in barcode_datas])
+            return True
+        except Exception as e:
+            print(f"Error deleting barcode images: {e}")
+            return False
 
 if __name__ == "__main__":
+    import sys
     init_db()
+    if "--rebuild-rollups" in sys.argv[1:]:
+        if AttendanceDB.rebuild_rollups():
+            print("Attendance rollups rebuilt")
+        else:
+            sys.exit(1)
+    if "--archive-attendance" in sys.argv[1:]:
+        for year, moved in AttendanceDB.archive_closed_years().items():
+            print(f"Archived {year}: {moved} rows")
@@ -108,6 +108,12 @@ def main():
         window = MainWindow()
         window.show()
         
+        # Finish database tasks, then close pooled connections on exit
+        from database import close_all_connections
+        from ui.db_worker import shutdown_db_worker
+        app.aboutToQuit.connect(shutdown_db_worker)
+        app.aboutToQuit.connect(close_all_connections)
+        
         print("Gym Management System started successfully!")
         print("نظام إدارة الجيم - تم تشغيل التطبيق بنجاح!")
         
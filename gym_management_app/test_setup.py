@@ -64,6 +64,21 @@ def test_database():
             else:
                 print("✗ No clients found in database")
                 return False
+            
+            # Test searching by a formatted phone number
+            for query in ("0123-456 7890", "012 345"):
+                if client_id not in [client.id for client in ClientDB.search(query)]:
+                    print(f"✗ Phone search for '{query}' did not find the client")
+                    return False
+            print("✓ Formatted phone search found the client")
+            
+            # Narrowing earlier results locally must agree with a fresh search
+            from ui.attendance import refine_clients
+            refined = refine_clients(ClientDB.search("012"), "0123-456")
+            if [client.id for client in refined] != [client.id for client in ClientDB.search("0123-456")]:
+                print("✗ Local refinement of a phone search dropped clients")
+                return False
+            print("✓ Local refinement matched a fresh phone search")
         else:
             print("✗ Failed to add sample client")
             return False
@@ -74,6 +89,59 @@ def test_database():
     
     return True
 
+def test_subscription_renewal():
+    """Sweep a lapsed subscription, renew it and scan the member in again"""
+    print("\nTesting subscription renewal...")
+    
+    try:
+        from datetime import date, timedelta
+        from database import ClientDB, BarcodeDB
+        from utils.barcode_utils import BarcodeGenerator
+        from utils.checkin import CheckInService
+        
+        client_id = ClientDB.add_client("عميل منتهي", "01000000000", "", "شهري", "2024-01-01", "2024-02-01")
+        barcode_data = BarcodeGenerator.generate_barcode_data(client_id)
+        BarcodeDB.create_barcode(client_id, barcode_data)
+        
+        ClientDB.expire_lapsed()
+        if CheckInService.scan(barcode_data).status != CheckInService.SUBSCRIPTION_EXPIRED:
+            print("✗ Scan after the expiry sweep was not refused")
+            return False
+        print("✓ Expiry sweep refused the lapsed member")
+        
+        # Renew from the edit form, which still shows the swept status
+        client = ClientDB.get_client(client_id)
+        new_end = (date.today() + timedelta(days=30)).strftime("%Y-%m-%d")
+        ClientDB.update_client(client_id, client.name, client.phone, client.email, client.subscription_type,
+                               client.subscription_start, new_end, client.status)
+        if ClientDB.get_client(client_id).status != 'active':
+            print("✗ Renewed client is not active")
+            return False
+        result = CheckInService.scan(barcode_data)
+        if result.status != CheckInService.OK:
+            print(f"✗ Scan after renewal returned {result.status}")
+            return False
+        print("✓ Renewed member scanned in")
+        
+        # Renewing the card twice leaves exactly one active barcode
+        from database import get_connection
+        from utils.barcode_utils import BarcodeManager
+        BarcodeManager.renew_barcode(client_id)
+        new_data, _ = BarcodeManager.renew_barcode(client_id)
+        active = get_connection().execute(
+            "SELECT barcode_data FROM barcodes WHERE client_id = ? AND status = 'active'", (client_id,)
+        ).fetchall()
+        if active != [(new_data,)]:
+            print(f"✗ Card renewal left {len(active)} active barcodes")
+            return False
+        print("✓ Card renewal expired the previous barcodes")
+        
+    except Exception as e:
+        print(f"✗ Subscription renewal test failed: {e}")
+        return False
+    
+    return True
+
 def test_barcode():
     """Test barcode generation"""
     print("\nTesting barcode generation...")
@@ -109,6 +177,147 @@ def test_barcode():
     
     return True
 
+def test_barcode_format(samples=20000):
+    """Property test: v2 barcodes round-trip and reject single-character errors"""
+    print("\nTesting barcode format...")
+    
+    try:
+        import random
+        from utils import barcode_format
+        
+        rng = random.Random(1234)
+        alphabet = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+        
+        # Boundary ids plus random ids across every width
+        ids = [1, 9, 10, 9999, 10000, 99999, 100000, 2**31 - 1, 2**63 - 1]
+        ids += [rng.randint(1, 10 ** rng.randint(1, 18)) for _ in range(samples)]
+        
+        for client_id in ids:
+            timestamp = f"{rng.randint(0, 10**14 - 1):014d}"
+            unique_id = f"{rng.getrandbits(32):08X}"
+            data = barcode_format.encode_v2(client_id, timestamp, unique_id)
+            decoded = barcode_format.decode(data)
+            if decoded != (2, client_id, timestamp, unique_id):
+                print(f"✗ Round trip failed for client {client_id}: {data}")
+                return False
+            
+            # Any single substituted character must be rejected
+            position = rng.randrange(len(barcode_format.V2_PREFIX), len(data))
+            replacement = rng.choice(alphabet.replace(data[position], ""))
+            corrupted = data[:position] + replacement + data[position + 1:]
+            if barcode_format.decode(corrupted) is not None:
+                print(f"✗ Corrupted barcode accepted: {corrupted}")
+                return False
+        print(f"✓ {len(ids)} v2 barcodes round-tripped and corruptions rejected")
+        
+        # Legacy codes, including ids wider than four digits
+        for client_id in (1, 42, 9999, 12345, 1234567):
+            legacy = f"GYM{client_id:04d}20240101120000a1b2c3d4"
+            if barcode_format.decode(legacy).client_id != client_id:
+                print(f"✗ Legacy barcode decoded wrongly: {legacy}")
+                return False
+        print("✓ Legacy barcodes decoded")
+        
+    except Exception as e:
+        print(f"✗ Barcode format test failed: {e}")
+        return False
+    
+    return True
+
+def test_code128_renderer(check_speed=False):
+    """Check the native Code128 renderer against python-barcode.
+    
+    The measured speedup is only asserted (10x) when check_speed is set.
+    """
+    print("\nTesting Code128 renderer...")
+    
+    try:
+        import random
+        import time
+        import tempfile
+        import barcode
+        from barcode.writer import ImageWriter
+        from utils import code128
+        from utils.barcode_utils import BarcodeGenerator
+        
+        rng = random.Random(1234)
+        samples = [BarcodeGenerator.generate_barcode_data(rng.randint(1, 10**9)) for _ in range(500)]
+        samples += [f"GYM{rng.randint(1, 99999):04d}20240101120000{rng.getrandbits(32):08x}" for _ in range(500)]
+        
+        # Both encoders must scan back to the same data
+        for data in samples:
+            reference = barcode.get_barcode_class('code128')(data).build()[0]
+            if code128.decode_modules(reference) != data or code128.decode_modules(code128.modules(data)) != data:
+                print(f"✗ Scan result differs for {data}")
+                return False
+            
+            bars = code128.render(data, module_width=2, text=False)
+            if code128.decode_modules(bars[0, ::2] == 0) != data:
+                print(f"✗ Rendered image does not scan back to {data}")
+                return False
+        print(f"✓ {len(samples)} barcodes scan identically to python-barcode")
+        
+        # Speed against python-barcode's ImageWriter (best of three rounds each)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            def best_time(save):
+                times = []
+                for _ in range(3):
+                    start = time.perf_counter()
+                    for data in samples[:50]:
+                        save(data)
+                    times.append(time.perf_counter() - start)
+                return min(times)
+            
+            reference_time = best_time(lambda data: barcode.get_barcode_class('code128')(
+                data, writer=ImageWriter()).save(os.path.join(tmp_dir, "reference")))
+            native_time = best_time(lambda data: code128.save_png(data, os.path.join(tmp_dir, "native.png")))
+        speedup = reference_time / native_time
+        if check_speed and speedup < 10:
+            print(f"✗ Native renderer is only {speedup:.1f}x faster than ImageWriter (expected 10x)")
+            return False
+        print(f"✓ Native renderer is {speedup:.1f}x faster than ImageWriter")
+        
+    except Exception as e:
+        print(f"✗ Code128 renderer test failed: {e}")
+        return False
+    
+    return True
+
+def test_barcode_preview():
+    """Check that cached barcode previews scan back to their data"""
+    print("\nTesting barcode preview...")
+    
+    try:
+        import math
+        import random
+        import itertools
+        from PyQt6.QtGui import qGray
+        from ui.barcode_preview import barcode_image
+        from utils import code128
+        from utils.barcode_utils import BarcodeGenerator
+        
+        rng = random.Random(1234)
+        samples = [BarcodeGenerator.generate_barcode_data(rng.randint(1, 10**9)) for _ in range(20)]
+        samples.append("GYM000120240101120000a1b2c3d4")
+        
+        for data in samples:
+            # Same size as the barcode management preview
+            image = barcode_image(data, 300, 100)
+            bars = [qGray(image.pixel(x, 0)) < 128 for x in range(image.width())]
+            
+            # Every module must be the same whole number of pixels
+            module_width = math.gcd(*(len(list(run)) for _, run in itertools.groupby(bars)))
+            if code128.decode_modules(bars[::module_width]) != data:
+                print(f"✗ Preview does not scan back to {data}")
+                return False
+        print(f"✓ {len(samples)} previews scan back to their data")
+        
+    except Exception as e:
+        print(f"✗ Barcode preview test failed: {e}")
+        return False
+    
+    return True
+
 def test_ui_components():
     """Test UI component imports"""
     print("\nTesting UI components...")
@@ -137,10 +346,17 @@ def cleanup_test_data():
     print("\nCleaning up test data...")
     
     try:
-        # Remove test database
+        # Close pooled connections before removing the database
+        from database import close_all_connections
+        close_all_connections()
+        
+        # Remove test database (and WAL side files)
         if os.path.exists("gym_management.db"):
             os.remove("gym_management.db")
             print("✓ Test database removed")
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(f"gym_management.db{suffix}"):
+                os.remove(f"gym_management.db{suffix}")
         
         # Remove test barcode images
         if os.path.exists("barcodes"):
@@ -165,10 +381,26 @@ def main():
     if not test_database():
         all_tests_passed = False
     
+    # Test subscription renewal
+    if not test_subscription_renewal():
+        all_tests_passed = False
+    
+    # Test barcode format (--exhaustive checks a million samples)
+    if not test_barcode_format(1000000 if "--exhaustive" in sys.argv else 20000):
+        all_tests_passed = False
+    
     # Test barcode generation
     if not test_barcode():
         all_tests_passed = False
     
+    # Test native Code128 renderer (--exhaustive also asserts the speedup)
+    if not test_code128_renderer("--exhaustive" in sys.argv):
+        all_tests_passed = False
+    
+    # Test barcode preview
+    if not test_barcode_preview():
+        all_tests_passed = False
+    
     # Test UI components
     if not test_ui_components():
         all_tests_passed = False
@@ -1,18 +1,88 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, 
                              QPushButton, QTableWidget, QTableWidgetItem, QComboBox,
                              QDateEdit, QMessageBox, QGroupBox, QFormLayout, QHeaderView,
-                             QCalendarWidget, QTextEdit, QSplitter)
-from PyQt6.QtCore import Qt, QDate, QTimer
-from PyQt6.QtGui import QFont
+                             QCalendarWidget, QTextEdit, QSplitter, QCompleter)
+from PyQt6.QtCore import Qt, QDate, QTimer, QAbstractListModel, QModelIndex, QSettings
+from PyQt6.QtGui import QFont, QColor, QTextCharFormat
 from database import ClientDB, AttendanceDB
+from utils.attendance_cache import occupancy
+from utils.checkin import CheckInService
+from ui.db_worker import db_worker
+from utils.text_utils import normalize_name, phone_digits, is_phone_like, search_terms
 from datetime import datetime, date
 
+# Client search settings
+SEARCH_LIMIT = 50
+SEARCH_DEBOUNCE_MS = 250
+
+# Attendance history rows loaded per page in the client panel
+HISTORY_PAGE_SIZE = 20
+
+# How often visits left open are checked out automatically
+AUTO_CHECKOUT_INTERVAL_MS = 5 * 60 * 1000
+
+# Calendar heatmap shades, from quiet to busiest day of the month
+HEATMAP_COLORS = ["#d5f4e6", "#a9dfbf", "#58d68d", "#27ae60"]
+
+def find_clients(search_text):
+    """Search clients, falling back to similar names for misspelled searches.
+    
+    Returns (clients, exact); exact is False for fuzzy fallback results.
+    """
+    clients = ClientDB.search(search_text, limit=SEARCH_LIMIT)
+    if clients:
+        return clients, True
+    return ClientDB.fuzzy_search(search_text, k=10), False
+
+def refine_clients(clients, search_text):
+    """Filter earlier search results locally with the same prefix rules as ClientDB.search"""
+    terms = search_terms(search_text)
+    # Phone-like input also matches the whole digit string as a phone prefix
+    digits = phone_digits(search_text) if is_phone_like(search_text) else None
+    matches = []
+    for client in clients:
+        tokens = search_terms(client.name) + search_terms(client.email) + [phone_digits(client.phone)]
+        if all(any(token.startswith(term) for token in tokens) for term in terms):
+            matches.append(client)
+        elif digits and phone_digits(client.phone).startswith(digits):
+            matches.append(client)
+    return matches
+
+class ClientListModel(QAbstractListModel):
+    """Search results shared by the client dropdown and the search completer"""
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.clients = []
+    
+    def set_clients(self, clients):
+        """Replace the results in one model reset"""
+        self.beginResetModel()
+        self.clients = list(clients)
+        self.endResetModel()
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.clients)
+    
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        client = self.clients[index.row()]
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            return f"{client.name} - {client.phone}"
+        if role == Qt.ItemDataRole.UserRole:
+            return client.id
+        return None
+
 class AttendanceWidget(QWidget):
     def __init__(self):
         super().__init__()
         self.setup_ui()
         self.setup_timer()
         self.refresh_data()
+        
+        # Rebuild the occupancy tracker (closing stale visits first)
+        db_worker().submit(AttendanceDB.load_occupancy, write=True)
     
     def setup_ui(self):
         """Setup attendance tracking UI"""
@@ -46,14 +116,39 @@ class AttendanceWidget(QWidget):
         checkin_layout = QFormLayout(checkin_group)
         checkin_layout.setSpacing(15)
         
+        # Barcode scan (checks the client in directly)
+        self.scan_input = QLineEdit()
+        self.scan_input.setPlaceholderText("امسح باركود العميل...")
+        self.scan_input.returnPressed.connect(self.process_scan)
+        checkin_layout.addRow("مسح الباركود:", self.scan_input)
+        
+        self.scan_result = QLabel("في انتظار مسح الباركود...")
+        checkin_layout.addRow(self.scan_result)
+        
         # Client search/selection
         self.client_search = QLineEdit()
         self.client_search.setPlaceholderText("ابحث عن العميل بالاسم أو الهاتف...")
         self.client_search.textChanged.connect(self.search_clients)
         checkin_layout.addRow("البحث عن العميل:", self.client_search)
         
+        # Keystrokes are coalesced before a search runs
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.run_search)
+        self.last_search = None  # (normalized query, clients, complete)
+        
+        # Search results feed both the completer and the dropdown
+        self.client_model = ClientListModel(self)
+        self.client_completer = QCompleter(self.client_model, self)
+        self.client_completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        self.client_completer.activated[QModelIndex].connect(self.on_completion_activated)
+        self.client_search.setCompleter(self.client_completer)
+        
         # Client dropdown
         self.client_combo = QComboBox()
+        self.client_combo.setModel(self.client_model)
+        self.client_combo.setPlaceholderText("لا توجد نتائج")
         self.client_combo.currentTextChanged.connect(self.on_client_selected)
         checkin_layout.addRow("اختر العميل:", self.client_combo)
         
@@ -62,7 +157,26 @@ class AttendanceWidget(QWidget):
         self.checkin_btn.setObjectName("success_button")
         self.checkin_btn.clicked.connect(self.mark_attendance)
         self.checkin_btn.setEnabled(False)
-        checkin_layout.addRow(self.checkin_btn)
+        
+        # Check-out button (closes the client's open visit)
+        self.checkout_btn = QPushButton("تسجيل الخروج")
+        self.checkout_btn.clicked.connect(self.check_out_client)
+        self.checkout_btn.setEnabled(False)
+        
+        buttons_layout = QHBoxLayout()
+        buttons_layout.addWidget(self.checkin_btn)
+        buttons_layout.addWidget(self.checkout_btn)
+        checkin_layout.addRow(buttons_layout)
+        
+        # Check-in policy (saved in the application settings)
+        self.policy_combo = QComboBox()
+        self.policy_combo.addItem("السماح بالدخول المتكرر", AttendanceDB.POLICY_NONE)
+        self.policy_combo.addItem("دخول واحد في اليوم", AttendanceDB.POLICY_ONE_PER_DAY)
+        self.policy_combo.addItem(f"منع إعادة الدخول خلال {AttendanceDB.passback_minutes} دقيقة",
+                                  AttendanceDB.POLICY_ANTI_PASSBACK)
+        self.policy_combo.setCurrentIndex(max(0, self.policy_combo.findData(AttendanceDB.policy)))
+        self.policy_combo.currentIndexChanged.connect(self.on_policy_changed)
+        checkin_layout.addRow("سياسة الدخول:", self.policy_combo)
         
         left_layout.addWidget(checkin_group)
         
@@ -86,6 +200,21 @@ class AttendanceWidget(QWidget):
         self.client_info_text.setPlainText("اختر عميل لعرض معلوماته...")
         
         info_layout.addWidget(self.client_info_text)
+        
+        # Visit summary and history (more rows load on scroll)
+        self.client_summary_label = QLabel("")
+        info_layout.addWidget(self.client_summary_label)
+        
+        self.history_table = QTableWidget()
+        self.history_table.setColumnCount(4)
+        self.history_table.setHorizontalHeaderLabels(["التاريخ", "وقت الدخول", "وقت الخروج", "الحالة"])
+        self.history_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.history_table.setMaximumHeight(200)
+        self.history_table.verticalScrollBar().valueChanged.connect(self.on_history_scrolled)
+        info_layout.addWidget(self.history_table)
+        self.history_client_id = None
+        self.history_more = False
+        
         parent_layout.addWidget(info_group)
     
     def create_stats_section(self, parent_layout):
@@ -122,7 +251,32 @@ class AttendanceWidget(QWidget):
                 margin: 5px;
             }
         """)
-        stats_layout.addWidget(self.attendance_count_label)
+        
+        # People in the gym now (checked in, not checked out)
+        self.occupancy_label = QLabel("في الصالة الآن: -")
+        self.occupancy_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.occupancy_label.setStyleSheet("""
+            QLabel {
+                font-size: 14px;
+                font-weight: bold;
+                color: #2980b9;
+                padding: 8px;
+                background-color: #d6eaf8;
+                border-radius: 4px;
+                margin: 5px;
+            }
+        """)
+        
+        counts_layout = QHBoxLayout()
+        counts_layout.addWidget(self.attendance_count_label)
+        counts_layout.addWidget(self.occupancy_label)
+        stats_layout.addLayout(counts_layout)
+        
+        # Month total, busiest hour and visits per subscription type (from the rollups)
+        self.stats_label = QLabel("")
+        self.stats_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.stats_label.setWordWrap(True)
+        stats_layout.addWidget(self.stats_label)
         
         parent_layout.addWidget(stats_group)
     
@@ -172,7 +326,10 @@ class AttendanceWidget(QWidget):
         self.calendar = QCalendarWidget()
         self.calendar.setMaximumHeight(200)
         self.calendar.clicked.connect(self.on_calendar_date_selected)
+        self.calendar.currentPageChanged.connect(self.on_calendar_page_changed)
         calendar_layout.addWidget(self.calendar)
+        self.month_counts = {}  # (year, month) -> {date: visits}
+        self.months_loading = set()
         
         right_layout.addWidget(calendar_group)
         
@@ -184,40 +341,82 @@ class AttendanceWidget(QWidget):
         self.timer.timeout.connect(self.update_time)
         self.timer.start(1000)  # Update every second
         self.update_time()
+        
+        # Close visits left open past the auto check-out limit
+        self.checkout_timer = QTimer(self)
+        self.checkout_timer.timeout.connect(self.auto_check_out)
+        self.checkout_timer.start(AUTO_CHECKOUT_INTERVAL_MS)
     
     def update_time(self):
         """Update current time display"""
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         self.time_label.setText(f"الوقت الحالي: {current_time}")
+        
+        # The tracker is updated on every check-in/out, so reading it is free
+        if occupancy.loaded:
+            self.occupancy_label.setText(f"في الصالة الآن: {len(occupancy)}")
+    
+    def auto_check_out(self):
+        """Close stale visits and refresh the table if any were closed"""
+        db_worker().submit(AttendanceDB.auto_check_out, write=True,
+                           on_result=lambda closed: self.refresh_data() if closed else None)
     
     def search_clients(self):
-        """Search and populate client dropdown"""
-        search_text = self.client_search.text().strip().lower()
+        """Schedule a client search once typing pauses"""
+        search_text = self.client_search.text().strip()
         
         if len(search_text) < 2:
-            self.client_combo.clear()
+            self.search_timer.stop()
+            db_worker().cancel("attendance_search")
+            self.last_search = None
+            self.client_model.set_clients([])
             self.checkin_btn.setEnabled(False)
             return
         
-        clients = ClientDB.get_all_clients()
-        matching_clients = []
+        self.search_timer.start()
+    
+    def run_search(self):
+        """Search clients, refining the previous results when the query extends it"""
+        search_text = self.client_search.text().strip()
+        if len(search_text) < 2:
+            return
         
-        for client in clients:
-            client_id, name, phone, email, sub_type, start_date, end_date, status, created_at = client
-            
-            if (search_text in name.lower() or 
-                search_text in phone.lower() or 
-                search_text in email.lower()):
-                matching_clients.append((client_id, f"{name} - {phone}"))
-        
-        self.client_combo.clear()
-        if matching_clients:
-            for client_id, display_text in matching_clients:
-                self.client_combo.addItem(display_text, client_id)
-            self.checkin_btn.setEnabled(True)
-        else:
-            self.client_combo.addItem("لا توجد نتائج")
-            self.checkin_btn.setEnabled(False)
+        query = normalize_name(search_text)
+        
+        # A completion picked from the popup is a result, not a new query
+        current = self.client_combo.currentIndex()
+        if current >= 0 and self.client_model.data(self.client_model.index(current)) == search_text:
+            return
+        
+        # Extending a complete result set can only narrow it
+        if self.last_search is not None:
+            last_query, last_clients, complete = self.last_search
+            if complete and query.startswith(last_query):
+                clients = refine_clients(last_clients, search_text)
+                if clients:
+                    db_worker().cancel("attendance_search")
+                    self.show_search_results(query, clients, True)
+                    return
+        
+        # A newer query supersedes the one in flight
+        db_worker().submit(
+            find_clients, search_text, key="attendance_search",
+            on_result=lambda result: self.show_search_results(query, *result)
+        )
+    
+    def show_search_results(self, query, clients, exact):
+        """Show search results in the dropdown and completer"""
+        self.last_search = (query, clients, exact and len(clients) < SEARCH_LIMIT)
+        self.client_model.set_clients(clients)
+        self.client_combo.setCurrentIndex(0 if clients else -1)
+        self.checkin_btn.setEnabled(bool(clients))
+        
+        if clients and self.client_search.hasFocus():
+            self.client_completer.complete()
+    
+    def on_completion_activated(self, index):
+        """Select the client picked from the completer"""
+        self.client_combo.setCurrentIndex(index.row())
     
     def on_client_selected(self):
         """Handle client selection"""
@@ -225,19 +424,82 @@ class AttendanceWidget(QWidget):
             client_id = self.client_combo.currentData()
             self.display_client_info(client_id)
             self.checkin_btn.setEnabled(True)
+            self.checkout_btn.setEnabled(True)
         else:
             self.checkin_btn.setEnabled(False)
+            self.checkout_btn.setEnabled(False)
     
     def display_client_info(self, client_id):
         """Display selected client information"""
-        clients = ClientDB.get_all_clients()
-        client_info = None
+        db_worker().submit(ClientDB.get_client, client_id, key="attendance_client",
+                           on_result=self.show_client_info)
+        db_worker().submit(AttendanceDB.get_client_summary, client_id, key="attendance_summary",
+                           on_result=self.show_client_summary)
+        
+        # Start the history over with the newest page
+        self.history_client_id = client_id
+        self.history_more = False
+        self.history_table.setRowCount(0)
+        self.load_history_page()
+    
+    def show_client_summary(self, summary):
+        """Show visit counts of the selected client"""
+        if summary is None:
+            self.client_summary_label.setText("")
+            return
+        self.client_summary_label.setText(
+            f"إجمالي الزيارات: {summary.total_visits} | "
+            f"زيارات هذا الشهر: {summary.visits_this_month} | "
+            f"آخر زيارة: {summary.last_visit or '-'}"
+        )
+    
+    def load_history_page(self):
+        """Load the next page of the selected client's attendance history"""
+        if self.history_client_id is None:
+            return
         
-        for client in clients:
-            if client[0] == client_id:
-                client_info = client
-                break
+        before = before_id = None
+        last_row = self.history_table.rowCount() - 1
+        if last_row >= 0:
+            # The last row carries its (check_in_time, id) key
+            before, before_id = self.history_table.item(last_row, 0).data(Qt.ItemDataRole.UserRole)
+        
+        client_id = self.history_client_id
+        self.history_more = False  # No further page requests until this one arrives
+        db_worker().submit(
+            AttendanceDB.get_attendance_by_client, client_id,
+            limit=HISTORY_PAGE_SIZE, before=before, before_id=before_id, key="attendance_history",
+            on_result=lambda records: self.append_history(client_id, records)
+        )
+    
+    def append_history(self, client_id, records):
+        """Append a page of history rows"""
+        if client_id != self.history_client_id:
+            return
         
+        row = self.history_table.rowCount()
+        self.history_table.setRowCount(row + len(records))
+        for record in records:
+            attendance_id, _, check_in_time, check_out_time, day, status = record[:6]
+            for col, value in enumerate((day, check_in_time, check_out_time, status)):
+                item = QTableWidgetItem(str(value) if value is not None else "-")
+                self.history_table.setItem(row, col, item)
+            self.history_table.item(row, 0).setData(Qt.ItemDataRole.UserRole, (check_in_time, attendance_id))
+            row += 1
+        
+        self.history_more = len(records) == HISTORY_PAGE_SIZE
+        # Keep loading while the table is not yet scrollable
+        if (self.history_more and self.history_table.isVisible()
+                and self.history_table.verticalScrollBar().maximum() == 0):
+            self.load_history_page()
+    
+    def on_history_scrolled(self, value):
+        """Load more history when scrolled to the bottom"""
+        if self.history_more and value >= self.history_table.verticalScrollBar().maximum() - 2:
+            self.load_history_page()
+    
+    def show_client_info(self, client_info):
+        """Show loaded client information"""
         if client_info:
             client_id, name, phone, email, sub_type, start_date, end_date, status, created_at = client_info
             
@@ -266,8 +528,8 @@ class AttendanceWidget(QWidget):
             
             self.client_info_text.setPlainText(info_text.strip())
             
-            # Change button color based on subscription status
-            if days_remaining <= 0:
+            # Change button color based on subscription status (the expiry sweeper sets the flag)
+            if status == 'expired' or days_remaining <= 0:
                 self.checkin_btn.setObjectName("danger_button")
                 self.checkin_btn.setText("اشتراك منتهي - تسجيل الحضور")
             elif days_remaining <= 7:
@@ -287,14 +549,32 @@ class AttendanceWidget(QWidget):
             return
         
         client_id = self.client_combo.currentData()
+        client_name = self.client_combo.currentText().split(" - ")[0]
+        self.checkin_btn.setEnabled(False)
         
         # Check if already marked today
         today = date.today().strftime("%Y-%m-%d")
-        attendance_records = AttendanceDB.get_attendance_by_client(client_id)
-        
-        already_marked_today = any(
-            record[4] == today for record in attendance_records  # record[4] is date
+        db_worker().submit(
+            AttendanceDB.has_attendance_on, client_id, today,
+            on_result=lambda already_marked_today: self.confirm_attendance(
+                client_id, client_name, already_marked_today
+            )
         )
+    
+    def on_policy_changed(self):
+        """Apply and save the chosen check-in policy"""
+        policy = self.policy_combo.currentData()
+        AttendanceDB.set_policy(policy)
+        QSettings().setValue("checkin/policy", policy)
+    
+    def confirm_attendance(self, client_id, client_name, already_marked_today):
+        """Ask before a repeat check-in, then record attendance"""
+        self.checkin_btn.setEnabled(bool(self.client_combo.currentData()))
+        
+        # Anti-passback allows a re-entry later the same day; insert_attendance checks the window
+        if already_marked_today and AttendanceDB.policy == AttendanceDB.POLICY_ONE_PER_DAY:
+            QMessageBox.warning(self, "تنبيه", f"تم تسجيل حضور {client_name} اليوم بالفعل.")
+            return
         
         if already_marked_today:
             reply = QMessageBox.question(
@@ -305,16 +585,29 @@ class AttendanceWidget(QWidget):
             if reply != QMessageBox.StandardButton.Yes:
                 return
         
-        success = AttendanceDB.mark_attendance(client_id)
-        
-        if success:
-            client_name = self.client_combo.currentText().split(" - ")[0]
+        db_worker().submit(
+            AttendanceDB.mark_attendance, client_id, write=True,
+            on_result=lambda result: self.on_attendance_marked(client_name, result)
+        )
+    
+    def on_attendance_marked(self, client_name, result):
+        """Handle attendance result"""
+        if result == AttendanceDB.REJECTED:
+            if AttendanceDB.policy == AttendanceDB.POLICY_ANTI_PASSBACK:
+                message = (f"لا يمكن تسجيل دخول {client_name} مرة أخرى قبل مرور "
+                           f"{AttendanceDB.passback_minutes} دقيقة على آخر دخول.")
+            else:
+                message = f"تم تسجيل حضور {client_name} اليوم بالفعل."
+            QMessageBox.warning(self, "تنبيه", message)
+        elif result == AttendanceDB.MARKED:
             QMessageBox.information(self, "نجح", f"تم تسجيل حضور {client_name} بنجاح!")
             
             # Clear form
             self.client_search.clear()
-            self.client_combo.clear()
             self.client_info_text.setPlainText("اختر عميل لعرض معلوماته...")
+            self.client_summary_label.setText("")
+            self.history_client_id = None
+            self.history_table.setRowCount(0)
             self.checkin_btn.setEnabled(False)
             
             # Refresh data
@@ -322,6 +615,48 @@ class AttendanceWidget(QWidget):
         else:
             QMessageBox.critical(self, "خطأ", "فشل في تسجيل الحضور!")
     
+    def check_out_client(self):
+        """Check the selected client out"""
+        client_id = self.client_combo.currentData()
+        if not client_id:
+            return
+        
+        client_name = self.client_combo.currentText().split(" - ")[0]
+        db_worker().submit(
+            AttendanceDB.check_out, client_id, write=True,
+            on_result=lambda success: self.on_checked_out(client_id, client_name, success)
+        )
+    
+    def on_checked_out(self, client_id, client_name, success):
+        """Handle check-out result"""
+        if success:
+            QMessageBox.information(self, "نجح", f"تم تسجيل خروج {client_name} بنجاح!")
+            self.refresh_data()
+            self.display_client_info(client_id)
+        else:
+            QMessageBox.warning(self, "تنبيه", f"لا توجد زيارة مفتوحة للعميل {client_name}.")
+    
+    def process_scan(self):
+        """Check in (or out) the client of a scanned barcode"""
+        barcode_data = self.scan_input.text().strip()
+        if not barcode_data:
+            return
+        
+        # Scans are writes: they run in order on the write worker
+        self.scan_input.clear()
+        db_worker().submit(CheckInService.scan, barcode_data, write=True,
+                           on_result=self.on_scan_result)
+    
+    def on_scan_result(self, result):
+        """Show the result of a scan"""
+        self.scan_result.setText(CheckInService.describe(result))
+        
+        if result.status in (CheckInService.OK, CheckInService.CHECKED_OUT):
+            self.refresh_data()
+        
+        if result.client_id:
+            self.display_client_info(result.client_id)
+    
     def filter_by_date(self):
         """Filter attendance by selected date"""
         selected_date = self.date_filter.date().toString("yyyy-MM-dd")
@@ -338,45 +673,47 @@ class AttendanceWidget(QWidget):
             date_filter = date.today().strftime("%Y-%m-%d")
         
         # Get all attendance records
-        from database import get_connection
-        conn = get_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("""
-                SELECT a.id, c.name, a.check_in_time, a.check_out_time, a.date, a.status
-                FROM attendance a
-                JOIN clients c ON a.client_id = c.id
-                WHERE a.date = ?
-                ORDER BY a.check_in_time DESC
-                """, (date_filter,))
-                
-                attendance_records = cursor.fetchall()
-                
-                self.attendance_table.setRowCount(len(attendance_records))
-                
-                for row, record in enumerate(attendance_records):
-                    for col, value in enumerate(record):
-                        if value is None:
-                            value = "-"
-                        item = QTableWidgetItem(str(value))
-                        
-                        # Color code status
-                        if col == 5:  # Status column
-                            if value == 'present':
-                                item.setBackground(Qt.GlobalColor.green)
-                            else:
-                                item.setBackground(Qt.GlobalColor.yellow)
-                        
-                        self.attendance_table.setItem(row, col, item)
+        db_worker().submit(
+            AttendanceDB.get_attendance_by_date, date_filter, key="attendance_table",
+            on_result=lambda records: self.show_attendance_data(date_filter, records)
+        )
+        db_worker().submit(
+            AttendanceDB.get_day_stats, date_filter, key="attendance_stats",
+            on_result=lambda stats: self.show_stats(date_filter, stats)
+        )
+    
+    def show_attendance_data(self, date_filter, attendance_records):
+        """Fill the attendance table"""
+        self.attendance_table.setRowCount(len(attendance_records))
+        
+        for row, record in enumerate(attendance_records):
+            for col, value in enumerate(record):
+                if value is None:
+                    value = "-"
+                item = QTableWidgetItem(str(value))
                 
-                # Update attendance count
-                self.attendance_count_label.setText(f"عدد الحاضرين في {date_filter}: {len(attendance_records)}")
+                # Color code status
+                if col == 5:  # Status column
+                    if value == 'present':
+                        item.setBackground(Qt.GlobalColor.green)
+                    else:
+                        item.setBackground(Qt.GlobalColor.yellow)
                 
-            except Exception as e:
-                print(f"Error loading attendance data: {e}")
-            finally:
-                conn.close()
+                self.attendance_table.setItem(row, col, item)
+    
+    def show_stats(self, date_filter, stats):
+        """Show the visit statistics of the selected date"""
+        if stats is None:
+            self.stats_label.setText("")
+            return
+        
+        self.attendance_count_label.setText(f"عدد الحاضرين في {date_filter}: {stats.visits}")
+        lines = [f"زيارات الشهر حتى هذا اليوم: {stats.visits_this_month}"]
+        if stats.peak_hour is not None:
+            lines.append(f"ساعة الذروة: {stats.peak_hour:02d}:00 ({stats.peak_visits} زيارة)")
+        if stats.by_type:
+            lines.append(" | ".join(f"{subscription_type}: {visits}" for subscription_type, visits in stats.by_type))
+        self.stats_label.setText("\n".join(lines))
     
     def refresh_data(self):
         """Refresh all data"""
@@ -388,7 +725,47 @@ class AttendanceWidget(QWidget):
         self.highlight_attendance_dates()
     
     def highlight_attendance_dates(self):
-        """Highlight dates with attendance records in calendar"""
-        # This would require custom calendar implementation
-        # For now, we'll keep it simple
-        pass
+        """Reload this month's visit counts and repaint the calendar heatmap"""
+        today = date.today()
+        self.month_counts.pop((today.year, today.month), None)
+        self.months_loading.discard((today.year, today.month))  # A new request supersedes it
+        self.on_calendar_page_changed(self.calendar.yearShown(), self.calendar.monthShown())
+    
+    def on_calendar_page_changed(self, year, month):
+        """Load the shown month and prefetch its neighbours"""
+        for offset in (0, -1, 1):
+            index = year * 12 + month - 1 + offset
+            self.load_calendar_month(index // 12, index % 12 + 1)
+    
+    def load_calendar_month(self, year, month):
+        """Fetch a month's per-day visit counts from the daily rollup unless cached"""
+        if (year, month) in self.month_counts or (year, month) in self.months_loading:
+            return
+        self.months_loading.add((year, month))
+        
+        first = QDate(year, month, 1)
+        db_worker().submit(
+            AttendanceDB.get_daily_counts,
+            first.toString("yyyy-MM-dd"), first.addMonths(1).addDays(-1).toString("yyyy-MM-dd"),
+            key=f"calendar_{year}_{month}",
+            on_result=lambda rows: self.paint_calendar_month(year, month, rows)
+        )
+    
+    def paint_calendar_month(self, year, month, rows):
+        """Shade each day of a month by its share of the month's busiest day"""
+        self.months_loading.discard((year, month))
+        counts = dict(rows)
+        self.month_counts[(year, month)] = counts
+        busiest = max(counts.values(), default=0)
+        
+        day = QDate(year, month, 1)
+        while day.month() == month:
+            visits = counts.get(day.toString("yyyy-MM-dd"), 0)
+            text_format = QTextCharFormat()
+            if visits:
+                level = min(len(HEATMAP_COLORS) - 1, (visits * len(HEATMAP_COLORS) - 1) // busiest)
+                text_format.setBackground(QColor(HEATMAP_COLORS[level]))
+                if level == len(HEATMAP_COLORS) - 1:
+                    text_format.setForeground(QColor("white"))
+            self.calendar.setDateTextFormat(day, text_format)
+            day = day.addDays(1)
@@ -1,17 +1,21 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, 
                              QPushButton, QTableWidget, QTableWidgetItem, QComboBox,
                              QMessageBox, QGroupBox, QFormLayout, QHeaderView,
-                             QTextEdit, QSplitter, QFileDialog, QProgressBar)
+                             QTextEdit, QSplitter, QFileDialog, QProgressBar, QScrollArea)
 from PyQt6.QtCore import Qt, QThread, pyqtSignal
-from PyQt6.QtGui import QFont, QPixmap
-from database import ClientDB, BarcodeDB
+from PyQt6.QtGui import QFont
+from database import ClientDB, BarcodeDB, close_connection
 from utils.barcode_utils import BarcodeGenerator, BarcodeManager
-import os
+from utils.checkin import CheckInService
+from utils.barcode_batch import BarcodeBatchJob
+from ui.barcode_preview import barcode_pixmap
+from ui.card_sheet import CardSheetWriter
+from ui.db_worker import db_worker
 
 class BarcodeGenerationThread(QThread):
     """Thread for generating barcodes without blocking UI"""
     progress = pyqtSignal(int)
-    finished = pyqtSignal(str, str)  # barcode_data, image_path
+    finished = pyqtSignal(str, str)  # barcode_data, image_path (empty, rendered on demand)
     error = pyqtSignal(str)
     
     def __init__(self, client_id, client_name):
@@ -27,23 +31,69 @@ class BarcodeGenerationThread(QThread):
             self.progress.emit(50)
             barcode_data = generator.generate_barcode_data(self.client_id)
             
+            # Images are rendered on demand for preview, export and printing
             self.progress.emit(75)
-            image_path = generator.create_barcode_image(barcode_data, self.client_name)
+            success = BarcodeDB.create_barcode(self.client_id, barcode_data)
             
             self.progress.emit(100)
             
-            if image_path:
-                # Save to database
-                success = BarcodeDB.create_barcode(self.client_id, barcode_data)
-                if success:
-                    self.finished.emit(barcode_data, image_path)
-                else:
-                    self.error.emit("فشل في حفظ الباركود في قاعدة البيانات")
+            if success:
+                self.finished.emit(barcode_data, "")
             else:
-                self.error.emit("فشل في إنشاء صورة الباركود")
+                self.error.emit("فشل في حفظ الباركود في قاعدة البيانات")
                 
         except Exception as e:
             self.error.emit(f"خطأ في إنشاء الباركود: {str(e)}")
+        finally:
+            close_connection()  # The thread exits; don't leave its connection pooled
+
+class BatchBarcodeThread(QThread):
+    """Thread for running a bulk barcode generation job"""
+    progress = pyqtSignal(int, int)  # done, total
+    finished = pyqtSignal(int, int, bool)  # created, failed, cancelled
+    error = pyqtSignal(str)
+    
+    def __init__(self, job):
+        super().__init__()
+        self.job = job
+        self.cancelled = False
+    
+    def cancel(self):
+        """Stop after the chunk in progress"""
+        self.cancelled = True
+    
+    def run(self):
+        try:
+            result = self.job.run(
+                progress=self.progress.emit,
+                is_cancelled=lambda: self.cancelled
+            )
+            self.finished.emit(result.created, result.failed, result.cancelled)
+        except Exception as e:
+            self.error.emit(f"خطأ في إنشاء الباركود: {str(e)}")
+        finally:
+            close_connection()
+
+class CardSheetThread(QThread):
+    """Thread for composing membership card sheets"""
+    progress = pyqtSignal(int)  # cards done
+    finished = pyqtSignal(int, int)  # cards, sheets
+    error = pyqtSignal(str)
+    
+    def __init__(self, save_path, barcode_ids=None):
+        super().__init__()
+        self.save_path = save_path
+        self.barcode_ids = barcode_ids
+    
+    def run(self):
+        try:
+            writer = CardSheetWriter(self.save_path)
+            cards = writer.write(BarcodeDB.iter_card_rows(self.barcode_ids), progress=self.progress.emit)
+            self.finished.emit(cards, writer.pages)
+        except Exception as e:
+            self.error.emit(f"خطأ في طباعة البطاقات: {str(e)}")
+        finally:
+            close_connection()
 
 class BarcodeManagementWidget(QWidget):
     def __init__(self):
@@ -95,6 +145,21 @@ class BarcodeManagementWidget(QWidget):
         self.generate_btn.clicked.connect(self.generate_barcode)
         generation_layout.addRow(self.generate_btn)
         
+        # Bulk generation buttons
+        batch_layout = QHBoxLayout()
+        
+        self.batch_btn = QPushButton("إنشاء باركود لكل العملاء بدون باركود")
+        self.batch_btn.clicked.connect(self.generate_batch_barcodes)
+        batch_layout.addWidget(self.batch_btn)
+        
+        self.cancel_batch_btn = QPushButton("إيقاف")
+        self.cancel_batch_btn.setObjectName("danger_button")
+        self.cancel_batch_btn.clicked.connect(self.cancel_batch)
+        self.cancel_batch_btn.setVisible(False)
+        batch_layout.addWidget(self.cancel_batch_btn)
+        
+        generation_layout.addRow(batch_layout)
+        
         # Progress bar
         self.progress_bar = QProgressBar()
         self.progress_bar.setVisible(False)
@@ -165,6 +230,11 @@ class BarcodeManagementWidget(QWidget):
         self.export_btn.setEnabled(False)
         info_layout.addWidget(self.export_btn)
         
+        # Card sheet button (selected rows, or every active barcode)
+        self.print_cards_btn = QPushButton("طباعة بطاقات العضوية")
+        self.print_cards_btn.clicked.connect(self.print_membership_cards)
+        info_layout.addWidget(self.print_cards_btn)
+        
         parent_layout.addWidget(info_group)
     
     def create_scanner_section(self, parent_layout):
@@ -209,7 +279,7 @@ class BarcodeManagementWidget(QWidget):
         filter_layout.addWidget(QLabel("تصفية حسب الحالة:"))
         
         self.status_filter = QComboBox()
-        self.status_filter.addItems(["الكل", "active", "inactive", "expired", "renewed"])
+        self.status_filter.addItems(["الكل", "active", "inactive", "lapsed", "expired", "renewed"])
         self.status_filter.currentTextChanged.connect(self.filter_barcodes)
         filter_layout.addWidget(self.status_filter)
         
@@ -252,7 +322,14 @@ class BarcodeManagementWidget(QWidget):
                 background-color: #f8f9fa;
             }
         """)
-        preview_layout.addWidget(self.barcode_preview)
+        
+        # Previews are shown at their own size (never scaled), scrolling if wider
+        preview_scroll = QScrollArea()
+        preview_scroll.setWidget(self.barcode_preview)
+        preview_scroll.setWidgetResizable(True)
+        preview_scroll.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        preview_scroll.setFrameShape(QScrollArea.Shape.NoFrame)
+        preview_layout.addWidget(preview_scroll)
         
         right_layout.addWidget(preview_group)
         
@@ -260,22 +337,35 @@ class BarcodeManagementWidget(QWidget):
     
     def load_clients(self):
         """Load clients into combo box"""
+        # Only show active clients
+        db_worker().submit(ClientDB.get_clients, status='active', key="barcode_clients",
+                           on_result=self.show_clients)
+    
+    def show_clients(self, clients):
+        """Fill the client combo box"""
+        self.client_combo.blockSignals(True)
         self.client_combo.clear()
         self.client_combo.addItem("اختر عميل...", None)
-        
-        clients = ClientDB.get_all_clients()
         for client in clients:
-            client_id, name, phone, email, sub_type, start_date, end_date, status, created_at = client
-            if status == 'active':  # Only show active clients
-                display_text = f"{name} - {phone}"
-                self.client_combo.addItem(display_text, client_id)
+            display_text = f"{client.name} - {client.phone}"
+            self.client_combo.addItem(display_text, client.id)
+        self.client_combo.blockSignals(False)
+        self.generate_btn.setEnabled(False)
     
     def on_client_selected(self):
         """Handle client selection"""
         client_id = self.client_combo.currentData()
+        self.generate_btn.setEnabled(False)
         if client_id:
             # Check if client already has a barcode
-            existing_barcode = BarcodeDB.get_client_barcode(client_id)
+            db_worker().submit(
+                BarcodeDB.get_client_barcode, client_id, key="barcode_existing",
+                on_result=lambda existing_barcode: self.confirm_client_selection(client_id, existing_barcode)
+            )
+    
+    def confirm_client_selection(self, client_id, existing_barcode):
+        """Enable generation, asking first if the client already has a barcode"""
+        if client_id == self.client_combo.currentData():
             if existing_barcode:
                 reply = QMessageBox.question(
                     self, "باركود موجود", 
@@ -286,8 +376,6 @@ class BarcodeManagementWidget(QWidget):
                     return
             
             self.generate_btn.setEnabled(True)
-        else:
-            self.generate_btn.setEnabled(False)
     
     def generate_barcode(self):
         """Generate barcode for selected client"""
@@ -331,6 +419,84 @@ class BarcodeManagementWidget(QWidget):
         
         QMessageBox.critical(self, "خطأ", error_message)
     
+    def generate_batch_barcodes(self):
+        """Generate barcodes for all active clients without one"""
+        job = BarcodeBatchJob.resume()
+        if job and job.pending:
+            reply = QMessageBox.question(
+                self, "استكمال", 
+                f"توجد عملية إنشاء سابقة غير مكتملة ({len(job.pending)} عميل متبقي).\nهل تريد استكمالها؟",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+            )
+            if reply != QMessageBox.StandardButton.Yes:
+                job = None
+        else:
+            job = None
+        
+        if job is not None:
+            self.start_batch_job(job)
+            return
+        
+        # Find clients without a barcode in the background
+        self.batch_btn.setEnabled(False)
+        db_worker().submit(BarcodeBatchJob.for_clients_without_barcode,
+                           on_result=self.start_batch_job, on_error=self.on_batch_error)
+    
+    def start_batch_job(self, job):
+        """Run a batch job in its own thread"""
+        if not job.client_ids:
+            self.batch_btn.setEnabled(True)
+            QMessageBox.information(self, "تنبيه", "جميع العملاء النشطين لديهم باركود بالفعل.")
+            return
+        
+        # Show progress bar
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setRange(0, len(job.client_ids))
+        self.progress_bar.setValue(len(job.client_ids) - len(job.pending))
+        self.generate_btn.setEnabled(False)
+        self.batch_btn.setEnabled(False)
+        self.cancel_batch_btn.setVisible(True)
+        
+        # Start batch thread
+        self.batch_thread = BatchBarcodeThread(job)
+        self.batch_thread.progress.connect(lambda done, total: self.progress_bar.setValue(done))
+        self.batch_thread.finished.connect(self.on_batch_finished)
+        self.batch_thread.error.connect(self.on_batch_error)
+        self.batch_thread.start()
+    
+    def cancel_batch(self):
+        """Cancel the running batch job"""
+        if hasattr(self, 'batch_thread'):
+            self.batch_thread.cancel()
+            self.cancel_batch_btn.setEnabled(False)
+    
+    def reset_batch_controls(self):
+        """Restore controls after a batch job"""
+        self.progress_bar.setVisible(False)
+        self.progress_bar.setRange(0, 100)
+        self.generate_btn.setEnabled(True)
+        self.batch_btn.setEnabled(True)
+        self.cancel_batch_btn.setVisible(False)
+        self.cancel_batch_btn.setEnabled(True)
+    
+    def on_batch_finished(self, created, failed, cancelled):
+        """Handle batch job completion"""
+        self.reset_batch_controls()
+        
+        message = f"تم إنشاء {created} باركود."
+        if failed:
+            message += f"\nفشل إنشاء {failed} باركود، يمكن استكمالها لاحقاً."
+        if cancelled:
+            message += "\nتم إيقاف العملية، يمكن استكمالها لاحقاً."
+        QMessageBox.information(self, "إنشاء الباركود", message)
+        
+        self.refresh_data()
+    
+    def on_batch_error(self, error_message):
+        """Handle batch job error"""
+        self.reset_batch_controls()
+        QMessageBox.critical(self, "خطأ", error_message)
+    
     def search_barcode(self):
         """Search for barcode"""
         search_text = self.barcode_search.text().strip()
@@ -390,31 +556,25 @@ class BarcodeManagementWidget(QWidget):
     
     def load_barcode_preview(self, barcode_data):
         """Load barcode image preview"""
-        image_path = f"barcodes/barcode_{barcode_data}.png"
-        if os.path.exists(image_path):
-            pixmap = QPixmap(image_path)
-            if not pixmap.isNull():
-                # Scale image to fit preview
-                scaled_pixmap = pixmap.scaled(
-                    300, 100, 
-                    Qt.AspectRatioMode.KeepAspectRatio, 
-                    Qt.TransformationMode.SmoothTransformation
-                )
-                self.barcode_preview.setPixmap(scaled_pixmap)
-            else:
-                self.barcode_preview.setText("فشل في تحميل صورة الباركود")
-        else:
-            self.barcode_preview.setText("صورة الباركود غير موجودة")
+        try:
+            self.barcode_preview.setPixmap(barcode_pixmap(barcode_data, 300, 100))
+        except Exception as e:
+            print(f"Error rendering barcode preview: {e}")
+            self.barcode_preview.setText("فشل في تحميل صورة الباركود")
     
     def activate_barcode(self):
         """Activate selected barcode"""
         if hasattr(self, 'selected_barcode_id'):
-            success = BarcodeManager.activate_barcode(self.selected_barcode_id)
-            if success:
-                QMessageBox.information(self, "نجح", "تم تفعيل الباركود بنجاح!")
-                self.refresh_data()
-            else:
-                QMessageBox.critical(self, "خطأ", "فشل في تفعيل الباركود!")
+            db_worker().submit(BarcodeManager.activate_barcode, self.selected_barcode_id,
+                               write=True, on_result=self.on_barcode_activated)
+    
+    def on_barcode_activated(self, success):
+        """Handle activation result"""
+        if success:
+            QMessageBox.information(self, "نجح", "تم تفعيل الباركود بنجاح!")
+            self.refresh_data()
+        else:
+            QMessageBox.critical(self, "خطأ", "فشل في تفعيل الباركود!")
     
     def deactivate_barcode(self):
         """Deactivate selected barcode"""
@@ -426,12 +586,16 @@ class BarcodeManagementWidget(QWidget):
             )
             
             if reply == QMessageBox.StandardButton.Yes:
-                success = BarcodeManager.deactivate_barcode(self.selected_barcode_id)
-                if success:
-                    QMessageBox.information(self, "نجح", "تم إلغاء تفعيل الباركود بنجاح!")
-                    self.refresh_data()
-                else:
-                    QMessageBox.critical(self, "خطأ", "فشل في إلغاء تفعيل الباركود!")
+                db_worker().submit(BarcodeManager.deactivate_barcode, self.selected_barcode_id,
+                                   write=True, on_result=self.on_barcode_deactivated)
+    
+    def on_barcode_deactivated(self, success):
+        """Handle deactivation result"""
+        if success:
+            QMessageBox.information(self, "نجح", "تم إلغاء تفعيل الباركود بنجاح!")
+            self.refresh_data()
+        else:
+            QMessageBox.critical(self, "خطأ", "فشل في إلغاء تفعيل الباركود!")
     
     def renew_barcode(self):
         """Renew selected barcode"""
@@ -445,38 +609,79 @@ class BarcodeManagementWidget(QWidget):
                 client_id = generator.get_client_id_from_barcode(self.selected_barcode_data)
                 
                 if client_id:
-                    new_barcode_data, image_path = BarcodeManager.renew_barcode(client_id)
-                    if new_barcode_data:
-                        QMessageBox.information(
-                            self, "نجح", 
-                            f"تم تجديد الباركود بنجاح!\nالباركود الجديد: {new_barcode_data}"
-                        )
-                        self.refresh_data()
-                    else:
-                        QMessageBox.critical(self, "خطأ", "فشل في تجديد الباركود!")
+                    db_worker().submit(BarcodeManager.renew_barcode, client_id,
+                                       write=True, on_result=self.on_barcode_renewed)
                 else:
                     QMessageBox.critical(self, "خطأ", "فشل في استخراج معرف العميل من الباركود!")
     
+    def on_barcode_renewed(self, result):
+        """Handle renewal result"""
+        new_barcode_data, image_path = result
+        if new_barcode_data:
+            QMessageBox.information(
+                self, "نجح", 
+                f"تم تجديد الباركود بنجاح!\nالباركود الجديد: {new_barcode_data}"
+            )
+            self.refresh_data()
+        else:
+            QMessageBox.critical(self, "خطأ", "فشل في تجديد الباركود!")
+    
     def export_barcode_image(self):
         """Export barcode image"""
         if hasattr(self, 'selected_barcode_data'):
-            image_path = f"barcodes/barcode_{self.selected_barcode_data}.png"
-            if os.path.exists(image_path):
-                save_path, _ = QFileDialog.getSaveFileName(
-                    self, "حفظ صورة الباركود", 
-                    f"barcode_{self.selected_barcode_data}.png",
-                    "PNG Files (*.png);;All Files (*)"
-                )
-                
-                if save_path:
-                    try:
-                        import shutil
-                        shutil.copy2(image_path, save_path)
-                        QMessageBox.information(self, "نجح", "تم حفظ صورة الباركود بنجاح!")
-                    except Exception as e:
-                        QMessageBox.critical(self, "خطأ", f"فشل في حفظ الصورة: {str(e)}")
-            else:
-                QMessageBox.warning(self, "تحذير", "صورة الباركود غير موجودة!")
+            save_path, _ = QFileDialog.getSaveFileName(
+                self, "حفظ صورة الباركود", 
+                f"barcode_{self.selected_barcode_data}.png",
+                "PNG Files (*.png);;All Files (*)"
+            )
+            
+            if save_path:
+                try:
+                    # Render the image now; nothing is kept on disk beforehand
+                    with open(save_path, "wb") as f:
+                        f.write(BarcodeGenerator.render_png(self.selected_barcode_data))
+                    QMessageBox.information(self, "نجح", "تم حفظ صورة الباركود بنجاح!")
+                except Exception as e:
+                    QMessageBox.critical(self, "خطأ", f"فشل في حفظ الصورة: {str(e)}")
+    
+    def print_membership_cards(self):
+        """Compose membership cards for the selected barcodes (or all active ones) onto A4 sheets"""
+        selected_rows = sorted({index.row() for index in self.barcode_table.selectionModel().selectedRows()})
+        barcode_ids = [int(self.barcode_table.item(row, 0).text()) for row in selected_rows] or None
+        
+        save_path, _ = QFileDialog.getSaveFileName(
+            self, "حفظ بطاقات العضوية", "membership_cards.pdf",
+            "PDF Files (*.pdf);;PNG Files (*.png)"
+        )
+        if not save_path:
+            return
+        
+        self.print_cards_btn.setEnabled(False)
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setRange(0, len(barcode_ids) if barcode_ids else 0)
+        
+        self.card_thread = CardSheetThread(save_path, barcode_ids)
+        self.card_thread.progress.connect(self.progress_bar.setValue)
+        self.card_thread.finished.connect(self.on_cards_printed)
+        self.card_thread.error.connect(self.on_cards_error)
+        self.card_thread.start()
+    
+    def on_cards_printed(self, cards, sheets):
+        """Handle card sheet completion"""
+        self.print_cards_btn.setEnabled(True)
+        self.progress_bar.setVisible(False)
+        self.progress_bar.setRange(0, 100)
+        if cards:
+            QMessageBox.information(self, "نجح", f"تم تجهيز {cards} بطاقة في {sheets} صفحة.")
+        else:
+            QMessageBox.information(self, "تنبيه", "لا توجد باركودات لطباعتها.")
+    
+    def on_cards_error(self, error_message):
+        """Handle card sheet error"""
+        self.print_cards_btn.setEnabled(True)
+        self.progress_bar.setVisible(False)
+        self.progress_bar.setRange(0, 100)
+        QMessageBox.critical(self, "خطأ", error_message)
     
     def process_scanned_barcode(self):
         """Process scanned barcode"""
@@ -485,12 +690,38 @@ class BarcodeManagementWidget(QWidget):
         if not barcode_data:
             return
         
-        # Validate barcode
-        from utils.barcode_utils import BarcodeGenerator
-        generator = BarcodeGenerator()
+        # Validate barcode, check subscription and mark attendance in one step
+        self.scanner_input.clear()
+        db_worker().submit(CheckInService.scan, barcode_data, write=True,
+                           on_result=self.on_scan_result)
+    
+    def on_scan_result(self, result):
+        """Show the result of a scan"""
+        self.scanner_result.setText(CheckInService.describe(result))
         
-        if not generator.validate_barcode(barcode_data):
-            self.scanner_result.setText("باركود غير صالح!")
+        if result.status == CheckInService.OK:
+            self.scanner_result.setStyleSheet("""
+                QLabel {
+                    padding: 10px;
+                    background-color: #d4edda;
+                    border: 1px solid #c3e6cb;
+                    border-radius: 4px;
+                    color: #155724;
+                    font-weight: bold;
+                }
+            """)
+        elif result.client_id:
+            self.scanner_result.setStyleSheet("""
+                QLabel {
+                    padding: 10px;
+                    background-color: #fff3cd;
+                    border: 1px solid #ffeaa7;
+                    border-radius: 4px;
+                    color: #856404;
+                    font-weight: bold;
+                }
+            """)
+        else:
             self.scanner_result.setStyleSheet("""
                 QLabel {
                     padding: 10px;
@@ -501,56 +732,6 @@ class BarcodeManagementWidget(QWidget):
                     font-weight: bold;
                 }
             """)
-            return
-        
-        # Get client ID from barcode
-        client_id = generator.get_client_id_from_barcode(barcode_data)
-        if not client_id:
-            self.scanner_result.setText("فشل في استخراج معرف العميل!")
-            return
-        
-        # Get barcode info from database
-        barcode_info = BarcodeDB.get_client_barcode(client_id)
-        if barcode_info:
-            barcode_id, client_id, stored_barcode_data, status, created_at, updated_at, client_name = barcode_info
-            
-            if stored_barcode_data == barcode_data:
-                if status == 'active':
-                    self.scanner_result.setText(f"✓ باركود صالح - العميل: {client_name}")
-                    self.scanner_result.setStyleSheet("""
-                        QLabel {
-                            padding: 10px;
-                            background-color: #d4edda;
-                            border: 1px solid #c3e6cb;
-                            border-radius: 4px;
-                            color: #155724;
-                            font-weight: bold;
-                        }
-                    """)
-                    
-                    # Auto mark attendance
-                    from database import AttendanceDB
-                    AttendanceDB.mark_attendance(client_id)
-                    
-                else:
-                    self.scanner_result.setText(f"⚠ باركود غير مفعل - العميل: {client_name}")
-                    self.scanner_result.setStyleSheet("""
-                        QLabel {
-                            padding: 10px;
-                            background-color: #fff3cd;
-                            border: 1px solid #ffeaa7;
-                            border-radius: 4px;
-                            color: #856404;
-                            font-weight: bold;
-                        }
-                    """)
-            else:
-                self.scanner_result.setText("باركود غير مطابق في قاعدة البيانات!")
-        else:
-            self.scanner_result.setText("باركود غير موجود في النظام!")
-        
-        # Clear scanner input
-        self.scanner_input.clear()
     
     def filter_barcodes(self):
         """Filter barcodes by status"""
@@ -580,43 +761,28 @@ class BarcodeManagementWidget(QWidget):
         self.load_clients()
         
         # Load barcodes table
-        from database import get_connection
-        conn = get_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("""
-                SELECT b.id, c.name, b.barcode_data, b.status, b.created_at, b.updated_at
-                FROM barcodes b
-                JOIN clients c ON b.client_id = c.id
-                ORDER BY b.created_at DESC
-                """)
-                
-                barcodes = cursor.fetchall()
-                
-                self.barcode_table.setRowCount(len(barcodes))
+        db_worker().submit(BarcodeDB.get_all_barcodes, key="barcode_table", on_result=self.show_barcodes)
+    
+    def show_barcodes(self, barcodes):
+        """Fill the barcode table"""
+        self.barcode_table.setRowCount(len(barcodes))
+        
+        for row, barcode in enumerate(barcodes):
+            for col, value in enumerate(barcode):
+                item = QTableWidgetItem(str(value))
                 
-                for row, barcode in enumerate(barcodes):
-                    for col, value in enumerate(barcode):
-                        item = QTableWidgetItem(str(value))
-                        
-                        # Color code status
-                        if col == 3:  # Status column
-                            if value == 'active':
-                                item.setBackground(Qt.GlobalColor.green)
-                            elif value == 'inactive':
-                                item.setBackground(Qt.GlobalColor.red)
-                            elif value == 'expired':
-                                item.setBackground(Qt.GlobalColor.yellow)
-                            else:
-                                item.setBackground(Qt.GlobalColor.cyan)
-                        
-                        self.barcode_table.setItem(row, col, item)
+                # Color code status
+                if col == 3:  # Status column
+                    if value == 'active':
+                        item.setBackground(Qt.GlobalColor.green)
+                    elif value == 'inactive':
+                        item.setBackground(Qt.GlobalColor.red)
+                    elif value in ('expired', 'lapsed'):
+                        item.setBackground(Qt.GlobalColor.yellow)
+                    else:
+                        item.setBackground(Qt.GlobalColor.cyan)
                 
-            except Exception as e:
-                print(f"Error loading barcode data: {e}")
-            finally:
-                conn.close()
+                self.barcode_table.setItem(row, col, item)
         
         # Reset selection
         self.reset_management_buttons()
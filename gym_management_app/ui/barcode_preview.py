@@ -0,0 +1,33 @@
+from functools import lru_cache
+from PyQt6.QtGui import QImage, QPixmap
+from utils.barcode_utils import BarcodeGenerator, code128
+
+# Number of (barcode_data, size) previews kept in memory
+PREVIEW_CACHE_SIZE = 256
+
+def barcode_image(barcode_data, width, height, show_text=True):
+    """Render a barcode in memory as a QImage about width x height.
+    
+    Bars are never resampled: every module is a whole number of pixels (at
+    least one), so the image is wider than width when the code has more
+    modules than width has pixels. Callers show it at its own size.
+    """
+    if code128 is None:
+        return QImage.fromData(BarcodeGenerator.render_png(barcode_data, show_text))
+    
+    # Render directly at the target resolution with whole-pixel modules
+    quiet_zone = 10
+    module_count = len(code128.modules(barcode_data)) + 2 * quiet_zone
+    module_width = max(1, width // module_count)
+    font_size = max(10, height // 6)
+    bars_height = height - font_size - 10 if show_text else height
+    
+    pixels = code128.render(barcode_data, module_width, max(1, bars_height), quiet_zone,
+                            text=show_text, font_size=font_size)
+    rows, columns = pixels.shape
+    return QImage(pixels.tobytes(), columns, rows, columns, QImage.Format.Format_Grayscale8).copy()
+
+@lru_cache(maxsize=PREVIEW_CACHE_SIZE)
+def barcode_pixmap(barcode_data, width, height, show_text=True):
+    """Render a barcode pixmap of about width x height (cached by data and size)"""
+    return QPixmap.fromImage(barcode_image(barcode_data, width, height, show_text))
@@ -0,0 +1,190 @@
+"""
+Membership card sheet compositor
+
+Lays out cards (barcode, client name, expiry date) on A4 sheets in a single
+streaming pass. Barcodes are drawn in memory as vector bars (tiny PDFs, sharp
+at any printer resolution) and only the current page is held, so memory stays
+bounded however many cards are printed. Output is a PDF, or one PNG per sheet
+(name_001.png, name_002.png, ...).
+"""
+
+import os
+from PyQt6.QtCore import Qt, QRectF, QMarginsF
+from PyQt6.QtGui import (QPainter, QPdfWriter, QPageSize, QImage, QFont, QFontMetrics,
+                         QPen, QColor)
+from ui.barcode_preview import barcode_image
+from utils.barcode_utils import code128
+
+# Sheet geometry in millimetres (ID-1 cards, 2 x 5 per A4 sheet)
+PAGE_WIDTH_MM = 210.0
+PAGE_HEIGHT_MM = 297.0
+CARD_WIDTH_MM = 85.6
+CARD_HEIGHT_MM = 54.0
+COLUMNS = 2
+ROWS = 5
+GAP_MM = 4.0
+PADDING_MM = 4.0
+QUIET_ZONE_MODULES = 10
+CARDS_PER_PAGE = COLUMNS * ROWS
+
+class CardSheetWriter:
+    """Compose membership cards onto A4 sheets"""
+    
+    def __init__(self, path, dpi=300):
+        self.path = path
+        self.dpi = dpi
+        self.pdf = path.lower().endswith(".pdf")
+        self.pages = 0
+        self._writer = None
+        self._image = None
+        self._painter = None
+    
+    def mm(self, value):
+        """Convert millimetres to device pixels"""
+        return value * self.dpi / 25.4
+    
+    def _page_path(self, number):
+        """File name of a PNG sheet"""
+        base, _ = os.path.splitext(self.path)
+        return f"{base}_{number:03d}.png"
+    
+    def _begin_page(self):
+        """Start a new sheet"""
+        if self.pdf:
+            if self._writer is None:
+                self._writer = QPdfWriter(self.path)
+                self._writer.setResolution(self.dpi)
+                self._writer.setPageSize(QPageSize(QPageSize.PageSizeId.A4))
+                self._writer.setPageMargins(QMarginsF(0, 0, 0, 0))
+                self._writer.setTitle("Membership cards")
+                self._painter = QPainter(self._writer)
+            else:
+                self._writer.newPage()
+        else:
+            self._image = QImage(round(self.mm(PAGE_WIDTH_MM)), round(self.mm(PAGE_HEIGHT_MM)),
+                                 QImage.Format.Format_Grayscale8)
+            dots_per_meter = round(self.dpi / 0.0254)
+            self._image.setDotsPerMeterX(dots_per_meter)
+            self._image.setDotsPerMeterY(dots_per_meter)
+            self._image.fill(Qt.GlobalColor.white)
+            self._painter = QPainter(self._image)
+        
+        self._painter.setRenderHint(QPainter.RenderHint.TextAntialiasing)
+        self.pages += 1
+    
+    def _end_page(self):
+        """Flush a PNG sheet to disk"""
+        if not self.pdf and self._painter is not None:
+            self._painter.end()
+            self._painter = None
+            if not self._image.save(self._page_path(self.pages)):
+                raise OSError(f"could not write {self._page_path(self.pages)}")
+            self._image = None
+    
+    def _draw_card(self, slot, barcode_data, client_name, subscription_end):
+        """Draw one card in its slot on the current sheet"""
+        column = slot % COLUMNS
+        row = slot // COLUMNS
+        margin_x = (PAGE_WIDTH_MM - COLUMNS * CARD_WIDTH_MM - (COLUMNS - 1) * GAP_MM) / 2
+        margin_y = (PAGE_HEIGHT_MM - ROWS * CARD_HEIGHT_MM - (ROWS - 1) * GAP_MM) / 2
+        card = QRectF(
+            self.mm(margin_x + column * (CARD_WIDTH_MM + GAP_MM)),
+            self.mm(margin_y + row * (CARD_HEIGHT_MM + GAP_MM)),
+            self.mm(CARD_WIDTH_MM),
+            self.mm(CARD_HEIGHT_MM)
+        )
+        painter = self._painter
+        
+        # Card outline (cut guide)
+        pen = QPen(QColor("#bdc3c7"))
+        pen.setWidthF(self.mm(0.3))
+        painter.setPen(pen)
+        painter.drawRoundedRect(card, self.mm(3), self.mm(3))
+        
+        content = card.adjusted(self.mm(PADDING_MM), self.mm(PADDING_MM),
+                                -self.mm(PADDING_MM), -self.mm(PADDING_MM))
+        painter.setPen(QColor("#2c3e50"))
+        
+        # Client name, elided to fit one line
+        name_font = QFont("Arial", 12, QFont.Weight.Bold)
+        painter.setFont(name_font)
+        name_rect = QRectF(content.left(), content.top(), content.width(), self.mm(7))
+        name = QFontMetrics(name_font, painter.device()).elidedText(
+            client_name or "", Qt.TextElideMode.ElideLeft, round(name_rect.width())
+        )
+        painter.drawText(name_rect, Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter, name)
+        
+        # Expiry date
+        painter.setFont(QFont("Arial", 9))
+        expiry_rect = QRectF(content.left(), name_rect.bottom(), content.width(), self.mm(6))
+        painter.drawText(expiry_rect, Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter,
+                         f"تاريخ الانتهاء: \u200e{subscription_end or '-'}")  # LRM keeps the date in order
+        
+        # Barcode, drawn in memory at print resolution
+        barcode_rect = QRectF(content.left(), expiry_rect.bottom() + self.mm(2),
+                              content.width(), content.bottom() - expiry_rect.bottom() - self.mm(2))
+        self._draw_barcode(barcode_rect, barcode_data)
+    
+    def _draw_barcode(self, rect, barcode_data):
+        """Draw a barcode centred in rect, as vector bars when the native encoder is available"""
+        painter = self._painter
+        if code128 is None:
+            image = barcode_image(barcode_data, int(rect.width()), int(rect.height()))
+            painter.drawImage(QRectF(rect.center().x() - image.width() / 2, rect.top(),
+                                     image.width(), image.height()), image)
+            return
+        
+        # Whole device pixels per module keep bar widths uniform
+        runs = code128.bar_runs(barcode_data)
+        width = runs[-1][1]
+        module = max(1, int(rect.width() // (width + 2 * QUIET_ZONE_MODULES)))
+        text_height = self.mm(4)
+        bars_height = rect.height() - text_height
+        left = round(rect.center().x() - width * module / 2)
+        
+        for start, end in runs:
+            painter.fillRect(QRectF(left + start * module, rect.top(), (end - start) * module, bars_height),
+                             Qt.GlobalColor.black)
+        
+        painter.setPen(Qt.GlobalColor.black)
+        painter.setFont(QFont("Courier New", 7))
+        painter.drawText(QRectF(rect.left(), rect.top() + bars_height, rect.width(), text_height),
+                         Qt.AlignmentFlag.AlignCenter, barcode_data)
+    
+    def write(self, cards, progress=None, is_cancelled=None):
+        """Lay out (barcode_data, client_name, subscription_end) cards; returns the card count.
+        
+        progress(cards) is called after each sheet; is_cancelled() is polled
+        between sheets.
+        """
+        count = 0
+        try:
+            for barcode_data, client_name, subscription_end in cards:
+                slot = count % CARDS_PER_PAGE
+                if slot == 0:
+                    if count:
+                        self._end_page()
+                        if progress:
+                            progress(count)
+                        if is_cancelled and is_cancelled():
+                            break
+                    self._begin_page()
+                self._draw_card(slot, barcode_data, client_name, subscription_end)
+                count += 1
+            
+            self._end_page()
+        finally:
+            if self._painter is not None:
+                self._painter.end()
+                self._painter = None
+            self._writer = None
+        
+        if progress:
+            progress(count)
+        return count
+    
+    def output_paths(self):
+        """Files written by the last run"""
+        if self.pdf:
+            return [self.path] if self.pages else []
+        return [self._page_path(number) for number in range(1, self.pages + 1)]
@@ -4,6 +4,8 @@ from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdi
 from PyQt6.QtCore import Qt, QDate
 from PyQt6.QtGui import QFont
 from database import ClientDB
+from ui.db_worker import db_worker
+from ui.expiring_soon import ExpiringSoonPanel
 
 class ClientManagementWidget(QWidget):
     def __init__(self):
@@ -32,6 +34,10 @@ class ClientManagementWidget(QWidget):
         self.create_client_table(content_layout)
         
         layout.addLayout(content_layout)
+        
+        # Members whose subscription ends soon
+        self.expiring_panel = ExpiringSoonPanel()
+        layout.addWidget(self.expiring_panel)
     
     def create_client_form(self, parent_layout):
         """Create client input form"""
@@ -75,7 +81,7 @@ class ClientManagementWidget(QWidget):
         
         # Status
         self.status_combo = QComboBox()
-        self.status_combo.addItems(["active", "inactive", "suspended"])
+        self.status_combo.addItems(["active", "inactive", "suspended", "expired"])
         form_layout.addRow("الحالة:", self.status_combo)
         
         # Buttons
@@ -170,12 +176,16 @@ class ClientManagementWidget(QWidget):
         start_date = self.start_date.date().toString("yyyy-MM-dd")
         end_date = self.end_date.date().toString("yyyy-MM-dd")
         
-        client_id = ClientDB.add_client(name, phone, email, subscription_type, start_date, end_date)
-        
+        db_worker().submit(ClientDB.add_client, name, phone, email, subscription_type, start_date, end_date,
+                           write=True, on_result=self.on_client_added)
+    
+    def on_client_added(self, client_id):
+        """Handle add client result"""
         if client_id:
             QMessageBox.information(self, "نجح", f"تم إضافة العميل بنجاح!\nرقم العميل: {client_id}")
             self.clear_form()
-            self.refresh_data()
+            self.load_clients()
+            self.update_expiring(client_id)
         else:
             QMessageBox.critical(self, "خطأ", "فشل في إضافة العميل!")
     
@@ -195,15 +205,20 @@ class ClientManagementWidget(QWidget):
         end_date = self.end_date.date().toString("yyyy-MM-dd")
         status = self.status_combo.currentText()
         
-        success = ClientDB.update_client(
-            self.selected_client_id, name, phone, email, 
-            subscription_type, start_date, end_date, status
+        client_id = self.selected_client_id
+        db_worker().submit(
+            ClientDB.update_client, client_id, name, phone, email, 
+            subscription_type, start_date, end_date, status,
+            write=True, on_result=lambda success: self.on_client_updated(client_id, success)
         )
-        
+    
+    def on_client_updated(self, client_id, success):
+        """Handle update client result"""
         if success:
             QMessageBox.information(self, "نجح", "تم تحديث بيانات العميل بنجاح!")
             self.clear_form()
-            self.refresh_data()
+            self.load_clients()
+            self.update_expiring(client_id)
         else:
             QMessageBox.critical(self, "خطأ", "فشل في تحديث بيانات العميل!")
     
@@ -219,13 +234,19 @@ class ClientManagementWidget(QWidget):
         )
         
         if reply == QMessageBox.StandardButton.Yes:
-            success = ClientDB.delete_client(self.selected_client_id)
-            if success:
-                QMessageBox.information(self, "نجح", "تم حذف العميل بنجاح!")
-                self.clear_form()
-                self.refresh_data()
-            else:
-                QMessageBox.critical(self, "خطأ", "فشل في حذف العميل!")
+            client_id = self.selected_client_id
+            db_worker().submit(ClientDB.delete_client, client_id, write=True,
+                               on_result=lambda success: self.on_client_deleted(client_id, success))
+    
+    def on_client_deleted(self, client_id, success):
+        """Handle delete client result"""
+        if success:
+            QMessageBox.information(self, "نجح", "تم حذف العميل بنجاح!")
+            self.clear_form()
+            self.load_clients()
+            self.expiring_panel.remove_client(client_id)
+        else:
+            QMessageBox.critical(self, "خطأ", "فشل في حذف العميل!")
     
     def on_client_selected(self):
         """Handle client selection from table"""
@@ -302,22 +323,42 @@ class ClientManagementWidget(QWidget):
     
     def filter_clients(self):
         """Filter clients based on search input"""
-        search_text = self.search_input.text().lower()
+        search_text = self.search_input.text().strip()
+        
+        if not search_text:
+            db_worker().cancel("client_filter")
+            for row in range(self.client_table.rowCount()):
+                self.client_table.setRowHidden(row, False)
+            return
+        
+        # Match against the client search index
+        db_worker().submit(ClientDB.search, search_text, limit=self.client_table.rowCount(),
+                           key="client_filter", on_result=self.apply_client_filter)
+    
+    def apply_client_filter(self, clients):
+        """Show only the table rows of matching clients"""
+        matching_ids = {client[0] for client in clients}
         
         for row in range(self.client_table.rowCount()):
-            match = False
-            for col in range(self.client_table.columnCount()):
-                item = self.client_table.item(row, col)
-                if item and search_text in item.text().lower():
-                    match = True
-                    break
-            
+            item = self.client_table.item(row, 0)  # ID column
+            match = item is not None and int(item.text()) in matching_ids
             self.client_table.setRowHidden(row, not match)
     
     def refresh_data(self):
-        """Refresh client data in table"""
-        clients = ClientDB.get_all_clients()
-        
+        """Refresh client data in table and the expiring-soon list"""
+        self.load_clients()
+        self.expiring_panel.refresh()
+    
+    def load_clients(self):
+        """Reload the client table"""
+        db_worker().submit(ClientDB.get_all_clients, key="client_table", on_result=self.show_clients)
+    
+    def update_expiring(self, client_id):
+        """Apply one added or edited client to the expiring-soon list"""
+        db_worker().submit(ClientDB.get_client, client_id, on_result=self.expiring_panel.client_changed)
+    
+    def show_clients(self, clients):
+        """Fill the client table"""
         self.client_table.setRowCount(len(clients))
         
         for row, client in enumerate(clients):
@@ -0,0 +1,136 @@
+"""
+Asynchronous database access for the UI
+
+Database calls run on QThreadPool workers and their results are delivered
+back on the GUI thread through signals, so widgets never block on SQLite.
+Each worker thread keeps its own pooled connection (see database.py).
+
+Reads share a small pool; writes go through a single-thread pool so they
+are applied in submission order. A request submitted with a key supersedes
+any earlier request with the same key: if the older one has not started it
+is skipped, otherwise its result is dropped.
+"""
+
+import itertools
+import threading
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+class _DbTask(QRunnable):
+    """One database call"""
+    
+    def __init__(self, worker, ticket, fn, args, kwargs):
+        super().__init__()
+        self.worker = worker
+        self.ticket = ticket
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+    
+    def run(self):
+        if not self.worker.is_pending(self.ticket):
+            return  # Superseded or cancelled before it started
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            result, error = None, str(e)
+        else:
+            error = None
+        
+        try:
+            if error is None:
+                self.worker.finished.emit(self.ticket, result)
+            else:
+                self.worker.failed.emit(self.ticket, error)
+        except RuntimeError:
+            pass  # The worker was destroyed at exit; nobody is waiting for the result
+
+class DbWorker(QObject):
+    """Runs database calls off the GUI thread and calls back on it"""
+    finished = pyqtSignal(int, object)  # ticket, result
+    failed = pyqtSignal(int, str)  # ticket, error message
+    
+    def __init__(self, read_threads=2, parent=None):
+        super().__init__(parent)
+        self._tickets = itertools.count(1)
+        self._lock = threading.Lock()
+        self._pending = {}  # ticket -> (key, on_result, on_error)
+        self._latest = {}  # key -> newest ticket
+        
+        # Worker threads never expire so their pooled connections are reused
+        self._read_pool = QThreadPool(self)
+        self._read_pool.setMaxThreadCount(read_threads)
+        self._read_pool.setExpiryTimeout(-1)
+        self._write_pool = QThreadPool(self)
+        self._write_pool.setMaxThreadCount(1)
+        self._write_pool.setExpiryTimeout(-1)
+        
+        self.finished.connect(self._on_finished)
+        self.failed.connect(self._on_failed)
+    
+    def submit(self, fn, *args, on_result=None, on_error=None, key=None, write=False, **kwargs):
+        """Run fn(*args, **kwargs) on a worker and return the request ticket"""
+        ticket = next(self._tickets)
+        with self._lock:
+            if key is not None:
+                superseded = self._latest.get(key)
+                if superseded is not None:
+                    self._pending.pop(superseded, None)
+                self._latest[key] = ticket
+            self._pending[ticket] = (key, on_result, on_error)
+        
+        pool = self._write_pool if write else self._read_pool
+        pool.start(_DbTask(self, ticket, fn, args, kwargs))
+        return ticket
+    
+    def cancel(self, key):
+        """Cancel the outstanding request for key"""
+        with self._lock:
+            ticket = self._latest.pop(key, None)
+            if ticket is not None:
+                self._pending.pop(ticket, None)
+    
+    def is_pending(self, ticket):
+        """Check whether a request is still wanted"""
+        with self._lock:
+            return ticket in self._pending
+    
+    def _take(self, ticket):
+        """Remove a finished request and return its callbacks"""
+        with self._lock:
+            request = self._pending.pop(ticket, None)
+            if request is not None and request[0] is not None and self._latest.get(request[0]) == ticket:
+                del self._latest[request[0]]
+        return request
+    
+    def _on_finished(self, ticket, result):
+        request = self._take(ticket)
+        if request is not None and request[1] is not None:
+            request[1](result)
+    
+    def _on_failed(self, ticket, message):
+        request = self._take(ticket)
+        if request is None:
+            return
+        if request[2] is not None:
+            request[2](message)
+        else:
+            print(f"Database task failed: {message}")
+    
+    def shutdown(self, msecs=5000):
+        """Wait for queued tasks so no write is lost on exit"""
+        self._read_pool.waitForDone(msecs)
+        self._write_pool.waitForDone(msecs)
+
+_worker = None
+
+def db_worker():
+    """Get the shared worker (created on first use, on the GUI thread)"""
+    global _worker
+    if _worker is None:
+        _worker = DbWorker()
+    return _worker
+
+def shutdown_db_worker():
+    """Wait for database tasks before connections are closed"""
+    if _worker is not None:
+        _worker.shutdown()
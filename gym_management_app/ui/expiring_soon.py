@@ -0,0 +1,136 @@
+"""
+Expiring-soon panel
+
+Lists active members whose subscription ends in the next few days, one page
+at a time from ClientDB.expiring_between. Client edits are applied to the
+loaded rows in place instead of reloading the list.
+"""
+
+import bisect
+from datetime import date, timedelta
+from PyQt6.QtWidgets import (QGroupBox, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
+                             QTableWidget, QTableWidgetItem, QHeaderView)
+from PyQt6.QtCore import Qt
+from database import ClientDB
+from ui.db_worker import db_worker
+
+# Days ahead counted as expiring soon, and rows loaded per page
+EXPIRING_SOON_DAYS = 7
+EXPIRING_PAGE_SIZE = 50
+
+def _sort_key(client):
+    """Position of a client in the list"""
+    return (client.subscription_end, client.id)
+
+class ExpiringSoonPanel(QGroupBox):
+    """Members whose subscription is about to end"""
+    
+    def __init__(self, parent=None):
+        super().__init__(f"اشتراكات تنتهي خلال {EXPIRING_SOON_DAYS} أيام", parent)
+        self.clients = []  # Loaded rows, in (subscription_end, id) order
+        self.more = False
+        self.window = None  # (start, end) dates of the loaded list
+        self.setup_ui()
+    
+    def setup_ui(self):
+        """Setup the panel UI"""
+        layout = QVBoxLayout(self)
+        
+        self.table = QTableWidget()
+        self.table.setColumnCount(5)
+        self.table.setHorizontalHeaderLabels([
+            "ID", "الاسم", "الهاتف", "تاريخ الانتهاء", "الأيام المتبقية"
+        ])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+        self.table.setAlternatingRowColors(True)
+        self.table.setMaximumHeight(220)
+        layout.addWidget(self.table)
+        
+        footer = QHBoxLayout()
+        self.count_label = QLabel("")
+        footer.addWidget(self.count_label)
+        footer.addStretch()
+        
+        self.more_btn = QPushButton("تحميل المزيد")
+        self.more_btn.clicked.connect(self.load_more)
+        self.more_btn.setEnabled(False)
+        footer.addWidget(self.more_btn)
+        layout.addLayout(footer)
+    
+    def refresh(self):
+        """Reload the first page for the window starting today"""
+        today = date.today()
+        self.window = (today.strftime("%Y-%m-%d"),
+                       (today + timedelta(days=EXPIRING_SOON_DAYS)).strftime("%Y-%m-%d"))
+        db_worker().submit(
+            ClientDB.expiring_between, *self.window, limit=EXPIRING_PAGE_SIZE,
+            key="expiring_soon", on_result=lambda clients: self.show_page(clients, reset=True)
+        )
+    
+    def load_more(self):
+        """Append the next page"""
+        if not self.more or not self.clients:
+            return
+        self.more_btn.setEnabled(False)
+        db_worker().submit(
+            ClientDB.expiring_between, *self.window, limit=EXPIRING_PAGE_SIZE, after=self.clients[-1],
+            key="expiring_soon", on_result=self.show_page
+        )
+    
+    def show_page(self, clients, reset=False):
+        """Show a loaded page"""
+        if reset:
+            self.clients = []
+            self.table.setRowCount(0)
+        for client in clients:
+            self.insert_row(len(self.clients), client)
+        self.more = len(clients) == EXPIRING_PAGE_SIZE
+        self.update_footer()
+    
+    def insert_row(self, position, client):
+        """Insert a client into the list and the table"""
+        self.clients.insert(position, client)
+        self.table.insertRow(position)
+        
+        days_left = (date.fromisoformat(client.subscription_end) - date.today()).days
+        values = [client.id, client.name, client.phone, client.subscription_end,
+                  "اليوم" if days_left == 0 else days_left]
+        for col, value in enumerate(values):
+            item = QTableWidgetItem(str(value if value is not None else "-"))
+            if col == 4 and days_left <= 2:
+                item.setBackground(Qt.GlobalColor.yellow)
+            self.table.setItem(position, col, item)
+    
+    def remove_client(self, client_id):
+        """Drop a client from the list if it is shown"""
+        for position, client in enumerate(self.clients):
+            if client.id == client_id:
+                del self.clients[position]
+                self.table.removeRow(position)
+                self.update_footer()
+                return
+    
+    def client_changed(self, client):
+        """Move, add or drop one client after it was added or edited"""
+        if self.window is None or client is None:
+            return
+        self.remove_client(client.id)
+        
+        start, end = self.window
+        if client.status != 'active' or not start <= (client.subscription_end or "") <= end:
+            return
+        
+        # Rows past the last loaded one arrive with a later page
+        key = _sort_key(client)
+        if self.more and self.clients and key > _sort_key(self.clients[-1]):
+            return
+        position = bisect.bisect_left([_sort_key(loaded) for loaded in self.clients], key)
+        self.insert_row(position, client)
+        self.update_footer()
+    
+    def update_footer(self):
+        """Update the row count and the load-more button"""
+        suffix = "+" if self.more else ""
+        self.count_label.setText(f"عدد العملاء: {len(self.clients)}{suffix}")
+        self.more_btn.setEnabled(self.more)
@@ -1,10 +1,11 @@
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QHBoxLayout, QVBoxLayout, 
                              QPushButton, QStackedWidget, QLabel, QFrame)
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QTimer, QSettings
 from PyQt6.QtGui import QFont
 from ui.client_management import ClientManagementWidget
 from ui.attendance import AttendanceWidget
 from ui.barcode_management import BarcodeManagementWidget
+from datetime import datetime, timedelta, time
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -17,8 +18,79 @@ class MainWindow(QMainWindow):
         from database import init_db
         init_db()
         
+        # Settings the pages depend on are applied before they are built
+        self.load_checkin_policy()
+        
         self.setup_ui()
         
+        # Startup maintenance runs in the background; the sweep goes first so
+        # the barcode index is loaded with the expired statuses
+        from ui.db_worker import db_worker
+        db_worker().submit(self.prepare_scan_data, write=True, on_result=self.on_expiry_swept)
+        db_worker().submit(self.maintain_barcode_images, write=True)
+        
+        # Repeat the expiry sweep every day just after midnight
+        self.expiry_timer = QTimer(self)
+        self.expiry_timer.setSingleShot(True)
+        self.expiry_timer.timeout.connect(self.sweep_expired_subscriptions)
+        self.schedule_expiry_sweep()
+        
+    @staticmethod
+    def load_checkin_policy():
+        """Apply the check-in policy saved in the application settings"""
+        from database import AttendanceDB
+        settings = QSettings()
+        try:
+            AttendanceDB.set_policy(
+                settings.value("checkin/policy", AttendanceDB.POLICY_NONE),
+                settings.value("checkin/passback_minutes", AttendanceDB.passback_minutes, type=int)
+            )
+        except (ValueError, TypeError) as e:
+            print(f"Warning: check-in policy not loaded: {e}")
+    
+    @staticmethod
+    def prepare_scan_data():
+        """Expire lapsed subscriptions, then load the barcode index (worker thread)"""
+        from database import ClientDB
+        from utils.barcode_cache import barcode_index
+        result = ClientDB.expire_lapsed()
+        try:
+            barcode_index.load()
+        except Exception as e:
+            print(f"Warning: barcode index not loaded: {e}")
+        return result
+    
+    @staticmethod
+    def maintain_barcode_images():
+        """Move part of the legacy flat image directory and drop dead images (worker thread)"""
+        from utils.image_store import BarcodeImageStore
+        try:
+            store = BarcodeImageStore()
+            store.migrate_flat_images()
+            store.collect_garbage()
+        except Exception as e:
+            print(f"Warning: barcode image maintenance failed: {e}")
+    
+    def schedule_expiry_sweep(self):
+        """Arm the expiry timer for the next midnight"""
+        now = datetime.now()
+        midnight = datetime.combine(now.date() + timedelta(days=1), time(0, 0, 5))
+        self.expiry_timer.start(int((midnight - now).total_seconds() * 1000))
+    
+    def sweep_expired_subscriptions(self):
+        """Expire lapsed subscriptions in the background"""
+        from database import ClientDB
+        from ui.db_worker import db_worker
+        db_worker().submit(ClientDB.expire_lapsed, write=True, on_result=self.on_expiry_swept)
+        self.schedule_expiry_sweep()
+    
+    def on_expiry_swept(self, result):
+        """Refresh the visible page when the sweep changed anything"""
+        if result and result.clients_expired:
+            print(f"Expired {result.clients_expired} subscriptions, "
+                  f"deactivated {result.barcodes_deactivated} barcodes")
+            self.stacked_widget.currentWidget().refresh_data()
+    
     def setup_ui(self):
         """Setup the main user interface"""
         # Create central widget
@@ -0,0 +1,116 @@
+from datetime import date
+import threading
+
+class TodayCheckIns:
+    """Ids of clients known to have checked in today.
+    
+    Only positive answers come from memory; a miss falls back to the
+    indexed database lookup, so check-ins from other processes are still
+    seen. The set empties itself when the date changes.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._date = None
+        self._ids = set()
+    
+    def _roll(self):
+        """Start a new set after midnight (lock held)"""
+        today = date.today().strftime("%Y-%m-%d")
+        if self._date != today:
+            self._date = today
+            self._ids = set()
+        return today
+    
+    def contains(self, client_id, day):
+        """Check whether client_id is known to have checked in on day"""
+        with self._lock:
+            return day == self._roll() and client_id in self._ids
+    
+    def add(self, client_id, day):
+        """Remember a check-in (ignored unless day is today)"""
+        with self._lock:
+            if day == self._roll():
+                self._ids.add(client_id)
+    
+    def clear(self):
+        """Forget all check-ins"""
+        with self._lock:
+            self._date = None
+            self._ids = set()
+    
+    def __len__(self):
+        with self._lock:
+            self._roll()
+            return len(self._ids)
+
+class Occupancy:
+    """Open visits (checked in, not yet checked out), kept current by AttendanceDB.
+    
+    Loaded once from the database and then updated on every check-in and
+    check-out, so the number of people in the gym is never recounted. A
+    client has at most one open visit: checking in again replaces it.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._visits = {}  # attendance id -> (client_id, check_in_time)
+        self._by_client = {}  # client id -> attendance id
+        self.loaded = False
+    
+    def load(self, rows):
+        """Replace the open visits with (attendance_id, client_id, check_in_time) rows"""
+        with self._lock:
+            self._visits = {}
+            self._by_client = {}
+            for attendance_id, client_id, check_in_time in sorted(rows, key=lambda row: row[2]):
+                self._open(attendance_id, client_id, check_in_time)
+            self.loaded = True
+    
+    def _open(self, attendance_id, client_id, check_in_time):
+        """Store a visit, replacing the client's earlier one (lock held)"""
+        earlier = self._by_client.get(client_id)
+        if earlier is not None:
+            del self._visits[earlier]
+        self._visits[attendance_id] = (client_id, check_in_time)
+        self._by_client[client_id] = attendance_id
+    
+    def _close(self, attendance_id):
+        """Drop a visit (lock held)"""
+        visit = self._visits.pop(attendance_id, None)
+        if visit is not None and self._by_client.get(visit[0]) == attendance_id:
+            del self._by_client[visit[0]]
+    
+    def check_in(self, attendance_id, client_id, check_in_time):
+        """Record a new open visit"""
+        with self._lock:
+            self._open(attendance_id, client_id, check_in_time)
+    
+    def check_out(self, attendance_id):
+        """Close a visit"""
+        with self._lock:
+            self._close(attendance_id)
+    
+    def expire(self, cutoff):
+        """Close visits that checked in before cutoff; returns how many were closed"""
+        with self._lock:
+            expired = [attendance_id for attendance_id, (_, check_in_time) in self._visits.items()
+                       if check_in_time < cutoff]
+            for attendance_id in expired:
+                self._close(attendance_id)
+            return len(expired)
+    
+    def clear(self):
+        """Forget all visits"""
+        with self._lock:
+            self._visits = {}
+            self._by_client = {}
+            self.loaded = False
+    
+    def __len__(self):
+        with self._lock:
+            return len(self._visits)
+
+# Shared instances used by AttendanceDB
+today_checkins = TodayCheckIns()
+occupancy = Occupancy()
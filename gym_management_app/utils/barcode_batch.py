@@ -0,0 +1,104 @@
+from collections import namedtuple
+import json
+import os
+
+from database import BarcodeDB
+from utils.barcode_utils import BarcodeGenerator
+
+DEFAULT_CHECKPOINT = os.path.join("exports", "barcode_batch_checkpoint.json")
+
+# Outcome of a batch run
+BatchResult = namedtuple("BatchResult", ["created", "failed", "cancelled"])
+
+class BarcodeBatchJob:
+    """Generate barcodes for many clients.
+    
+    Only the barcode rows are written; images are rendered on demand for
+    preview, export and printing. Progress is checkpointed after every
+    chunk so an interrupted or cancelled job can be resumed.
+    """
+    
+    def __init__(self, client_ids, checkpoint_path=DEFAULT_CHECKPOINT, chunk_size=500):
+        self.client_ids = list(client_ids)
+        self.checkpoint_path = checkpoint_path
+        self.chunk_size = chunk_size
+        self.done = set()
+    
+    @classmethod
+    def for_clients_without_barcode(cls, **kwargs):
+        """Create a job for all active clients that have no active barcode"""
+        return cls(BarcodeDB.get_clients_without_barcode(), **kwargs)
+    
+    @classmethod
+    def resume(cls, checkpoint_path=DEFAULT_CHECKPOINT, **kwargs):
+        """Load an interrupted job from its checkpoint, or None if there is none"""
+        if not os.path.exists(checkpoint_path):
+            return None
+        try:
+            with open(checkpoint_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error reading batch checkpoint: {e}")
+            return None
+        
+        job = cls(state["client_ids"], checkpoint_path=checkpoint_path, **kwargs)
+        job.done = set(state["done"])
+        return job
+    
+    @property
+    def pending(self):
+        """Client ids not yet processed"""
+        return [client_id for client_id in self.client_ids if client_id not in self.done]
+    
+    def _save_checkpoint(self):
+        """Write the checkpoint atomically"""
+        directory = os.path.dirname(self.checkpoint_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"client_ids": self.client_ids, "done": sorted(self.done)}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+    
+    def _clear_checkpoint(self):
+        """Remove the checkpoint of a finished job"""
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+    
+    def run(self, progress=None, is_cancelled=None):
+        """Run the job.
+        
+        progress(done, total) is called after each chunk; is_cancelled() is
+        polled between chunks.
+        """
+        pending = self.pending
+        total = len(self.client_ids)
+        processed = total - len(pending)
+        created = 0
+        failed = 0
+        
+        self._save_checkpoint()
+        
+        for start in range(0, len(pending), self.chunk_size):
+            if is_cancelled and is_cancelled():
+                return BatchResult(created, failed, True)
+            
+            chunk = pending[start:start + self.chunk_size]
+            rows = [(client_id, BarcodeGenerator.generate_barcode_data(client_id)) for client_id in chunk]
+            
+            # One executemany transaction per chunk, then checkpoint it.
+            # Failed clients stay pending so a resumed run retries them.
+            if BarcodeDB.create_barcodes(rows):
+                created += len(rows)
+                self.done.update(chunk)
+            else:
+                failed += len(rows)
+            self._save_checkpoint()
+            
+            processed += len(chunk)
+            if progress:
+                progress(processed, total)
+        
+        if not failed:
+            self._clear_checkpoint()
+        return BatchResult(created, failed, False)
@@ -0,0 +1,132 @@
+from collections import namedtuple
+import threading
+
+# Cached scan decision data for one barcode
+BarcodeEntry = namedtuple(
+    "BarcodeEntry",
+    ["barcode_id", "client_id", "status", "subscription_end", "client_name"]
+)
+
+_LOAD_QUERY = """
+SELECT b.barcode_data, b.id, b.client_id, b.status, c.subscription_end, c.name
+FROM barcodes b
+JOIN clients c ON c.id = b.client_id
+"""
+
+class BarcodeIndex:
+    """Resident barcode_data -> member index, kept current by BarcodeDB/ClientDB writes.
+
+    The index is optional: until load() is called lookups miss and writes are
+    ignored, so callers fall back to SQLite.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._by_id = {}
+        self._by_client = {}
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, conn=None):
+        """Load every barcode from the database"""
+        if conn is None:
+            from database import get_connection
+            conn = get_connection()
+
+        # Query under the lock: writers commit before updating the index, so
+        # no write can fall between this snapshot and installing it
+        with self._lock:
+            rows = conn.execute(_LOAD_QUERY).fetchall()
+            self._entries.clear()
+            self._by_id.clear()
+            self._by_client.clear()
+            for barcode_data, *fields in rows:
+                self._store(barcode_data, BarcodeEntry(*fields))
+            self.loaded = True
+        return len(rows)
+
+    def clear(self):
+        """Drop all entries and disable the index"""
+        with self._lock:
+            self._entries.clear()
+            self._by_id.clear()
+            self._by_client.clear()
+            self.loaded = False
+
+    def _store(self, barcode_data, entry):
+        """Store an entry and its secondary keys (lock held)"""
+        self._entries[barcode_data] = entry
+        self._by_id[entry.barcode_id] = barcode_data
+        self._by_client.setdefault(entry.client_id, set()).add(barcode_data)
+
+    def get(self, barcode_data):
+        """Look up a barcode, counting hits and misses"""
+        with self._lock:
+            entry = self._entries.get(barcode_data)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def put(self, barcode_data, entry):
+        """Add or replace a barcode entry"""
+        with self._lock:
+            if self.loaded:
+                self._store(barcode_data, entry)
+
+    def set_status(self, barcode_id, status):
+        """Update the status of a barcode"""
+        with self._lock:
+            barcode_data = self._by_id.get(barcode_id)
+            if barcode_data is not None:
+                entry = self._entries[barcode_data]
+                self._entries[barcode_data] = entry._replace(status=status)
+
+    def update_client(self, client_id, client_name, subscription_end):
+        """Update client fields on all barcodes of a client"""
+        with self._lock:
+            for barcode_data in self._by_client.get(client_id, ()):
+                entry = self._entries[barcode_data]
+                self._entries[barcode_data] = entry._replace(
+                    client_name=client_name, subscription_end=subscription_end
+                )
+
+    def remove_client(self, client_id):
+        """Remove all barcodes of a deleted client"""
+        with self._lock:
+            for barcode_data in self._by_client.pop(client_id, ()):
+                entry = self._entries.pop(barcode_data)
+                self._by_id.pop(entry.barcode_id, None)
+
+    def check_consistency(self, conn=None, repair=False):
+        """Compare the index with the database and return mismatched barcodes"""
+        if conn is None:
+            from database import get_connection
+            conn = get_connection()
+
+        expected = {barcode_data: BarcodeEntry(*fields)
+                    for barcode_data, *fields in conn.execute(_LOAD_QUERY).fetchall()}
+        with self._lock:
+            mismatched = [barcode_data for barcode_data in expected.keys() | self._entries.keys()
+                          if expected.get(barcode_data) != self._entries.get(barcode_data)]
+
+        if mismatched and repair:
+            self.load(conn)
+        return mismatched
+
+    def stats(self):
+        """Get index size and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+# Shared instance used by the database layer and the check-in service
+barcode_index = BarcodeIndex()
@@ -0,0 +1,69 @@
+"""
+Barcode data formats
+
+v1 (legacy): GYM + client id (zero padded to 4 digits) + timestamp (14 digits)
+             + 8 lowercase hex characters
+v2:          GYMV2 + id length (1 base36 char) + client id (decimal)
+             + timestamp (14 digits) + 8 uppercase hex characters
+             + check character (Luhn mod 36)
+
+Both formats are validated and decoded without touching the database.
+"""
+
+from collections import namedtuple
+import re
+
+_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_VALUES = {char: value for value, char in enumerate(_ALPHABET)}
+
+V1_PREFIX = "GYM"
+V2_PREFIX = "GYMV2"
+
+# The id field of v1 codes is everything before the fixed-width tail, so
+# codes issued for ids above 9999 decode correctly too
+_V1_PATTERN = re.compile(r"GYM(\d{4,})(\d{14})([0-9a-f]{8})")
+_V2_PATTERN = re.compile(r"GYMV2([1-9A-Z])(\d+)(\d{14})([0-9A-F]{8})([0-9A-Z])")
+
+# Decoded barcode fields
+DecodedBarcode = namedtuple("DecodedBarcode", ["version", "client_id", "timestamp", "unique_id"])
+
+def check_character(payload):
+    """Compute the Luhn mod 36 check character of an uppercase alphanumeric payload"""
+    total = 0
+    factor = 2
+    for char in reversed(payload):
+        addend = factor * _VALUES[char]
+        total += addend // 36 + addend % 36
+        factor = 1 if factor == 2 else 2
+    return _ALPHABET[-total % 36]
+
+def encode_v2(client_id, timestamp, unique_id):
+    """Build v2 barcode data"""
+    if client_id < 1:
+        raise ValueError("client id must be positive")
+    digits = str(client_id)
+    if len(digits) >= len(_ALPHABET):
+        raise ValueError("client id too large")
+    payload = f"{V2_PREFIX}{_ALPHABET[len(digits)]}{digits}{timestamp}{unique_id.upper()}"
+    return payload + check_character(payload)
+
+def decode(barcode_data):
+    """Decode barcode data, returning None when it is not a valid v1 or v2 code"""
+    if not barcode_data:
+        return None
+    
+    if barcode_data.startswith(V2_PREFIX):
+        match = _V2_PATTERN.fullmatch(barcode_data)
+        if not match:
+            return None
+        length, digits, timestamp, unique_id, check = match.groups()
+        if (_VALUES[length] != len(digits) or digits[0] == "0"
+                or check_character(barcode_data[:-1]) != check):
+            return None
+        return DecodedBarcode(2, int(digits), timestamp, unique_id)
+    
+    match = _V1_PATTERN.fullmatch(barcode_data)
+    if not match:
+        return None
+    digits, timestamp, unique_id = match.groups()
+    return DecodedBarcode(1, int(digits), timestamp, unique_id)
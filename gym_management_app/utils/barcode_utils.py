@@ -1,60 +1,60 @@
 import barcode
 from barcode.writer import ImageWriter
-import os
+import io
 import uuid
 from datetime import datetime
+from utils import barcode_format
+from utils.image_store import BarcodeImageStore
+
+try:
+    from utils import code128
+except ImportError:  # NumPy not installed, render with python-barcode
+    code128 = None
 
 class BarcodeGenerator:
-    def __init__(self):
-        self.barcode_dir = "barcodes"
-        if not os.path.exists(self.barcode_dir):
-            os.makedirs(self.barcode_dir)
+    def __init__(self, barcode_dir="barcodes"):
+        self.barcode_dir = barcode_dir
+        self.store = BarcodeImageStore(barcode_dir)
     
-    def generate_barcode_data(self, client_id):
+    @staticmethod
+    def generate_barcode_data(client_id):
         """Generate unique barcode data for client"""
         timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        unique_id = str(uuid.uuid4())[:8]
-        barcode_data = f"GYM{client_id:04d}{timestamp}{unique_id}"
+        unique_id = uuid.uuid4().hex[:8]
+        barcode_data = barcode_format.encode_v2(client_id, timestamp, unique_id)
         return barcode_data
     
-    def create_barcode_image(self, barcode_data, client_name=""):
-        """Create barcode image file"""
+    def create_barcode_image(self, barcode_data, client_name="", show_text=True, record=True):
+        """Create barcode image file in the sharded image store"""
         try:
-            # Use Code128 barcode format
-            code128 = barcode.get_barcode_class('code128')
-            barcode_instance = code128(barcode_data, writer=ImageWriter())
-            
-            # Generate filename
-            filename = f"barcode_{barcode_data}"
-            filepath = os.path.join(self.barcode_dir, filename)
-            
-            # Save barcode image
-            barcode_instance.save(filepath)
-            
-            return f"{filepath}.png"
+            png_bytes = self.render_png(barcode_data, show_text)
+            return self.store.save(barcode_data, png_bytes, record=record)
         except Exception as e:
             print(f"Error creating barcode image: {e}")
             return None
     
-    def validate_barcode(self, barcode_data):
-        """Validate barcode format"""
-        if not barcode_data:
-            return False
+    @staticmethod
+    def render_png(barcode_data, show_text=True):
+        """Render barcode to PNG bytes in memory"""
+        if code128 is not None:
+            return code128.encode_png(code128.render(barcode_data, text=show_text))
         
-        # Check if barcode starts with GYM and has proper length
-        if barcode_data.startswith('GYM') and len(barcode_data) >= 20:
-            return True
-        return False
+        code128_class = barcode.get_barcode_class('code128')
+        buffer = io.BytesIO()
+        code128_class(barcode_data, writer=ImageWriter()).write(buffer, options={"write_text": show_text})
+        return buffer.getvalue()
+    
+    @staticmethod
+    def validate_barcode(barcode_data):
+        """Validate barcode format (v2 check character or legacy v1 layout)"""
+        return barcode_format.decode(barcode_data) is not None
     
-    def get_client_id_from_barcode(self, barcode_data):
+    @staticmethod
+    def get_client_id_from_barcode(barcode_data):
         """Extract client ID from barcode data"""
-        try:
-            if self.validate_barcode(barcode_data):
-                # Extract client ID from barcode (positions 3-7)
-                client_id = int(barcode_data[3:7])
-                return client_id
-        except Exception as e:
-            print(f"Error extracting client ID from barcode: {e}")
+        decoded = barcode_format.decode(barcode_data)
+        if decoded:
+            return decoded.client_id
         return None
 
 # Barcode status management
@@ -63,6 +63,7 @@ class BarcodeManager:
     INACTIVE = "inactive"
     EXPIRED = "expired"
     RENEWED = "renewed"
+    LAPSED = "lapsed"  # Paused by the expiry sweep until the subscription is renewed
     
     @staticmethod
     def activate_barcode(barcode_id):
@@ -77,25 +78,19 @@ class BarcodeManager:
         return BarcodeDB.update_barcode_status(barcode_id, BarcodeManager.INACTIVE)
     
     @staticmethod
-    def renew_barcode(client_id):
-        """Renew barcode for client"""
+    def renew_barcode(client_id, write_image=False):
+        """Renew barcode for client (the image file is only written on request)"""
         from database import BarcodeDB
         
-        # Get existing barcode
-        existing_barcode = BarcodeDB.get_client_barcode(client_id)
-        if existing_barcode:
-            # Mark old barcode as expired
-            BarcodeDB.update_barcode_status(existing_barcode[0], BarcodeManager.EXPIRED)
-        
         # Generate new barcode
         generator = BarcodeGenerator()
         new_barcode_data = generator.generate_barcode_data(client_id)
         
-        # Create new barcode record
-        success = BarcodeDB.create_barcode(client_id, new_barcode_data)
+        # Expire the client's current barcodes and add the new one atomically
+        success = BarcodeDB.renew_barcode(client_id, new_barcode_data)
         if success:
-            # Generate barcode image
-            image_path = generator.create_barcode_image(new_barcode_data)
+            # Images are rendered on demand; write a file only when asked
+            image_path = generator.create_barcode_image(new_barcode_data) if write_image else None
             return new_barcode_data, image_path
         
         return None, None
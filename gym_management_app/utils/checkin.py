@@ -0,0 +1,171 @@
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+import time
+
+from database import transaction, AttendanceDB
+from utils.barcode_utils import BarcodeGenerator, BarcodeManager
+from utils.barcode_cache import barcode_index, BarcodeEntry
+
+# Structured result of a scan
+ScanResult = namedtuple(
+    "ScanResult",
+    ["status", "client_id", "client_name", "subscription_end", "attendance_id"]
+)
+
+# Scan-to-check-in service
+class CheckInService:
+    OK = "ok"
+    INVALID = "invalid"
+    NOT_FOUND = "not_found"
+    BARCODE_INACTIVE = "barcode_inactive"
+    SUBSCRIPTION_EXPIRED = "subscription_expired"
+    ALREADY_CHECKED_IN = "already_checked_in"
+    CHECKED_OUT = "checked_out"
+    ERROR = "error"
+    
+    MESSAGES = {
+        OK: "✓ تم تسجيل الحضور - العميل: {name}",
+        INVALID: "باركود غير صالح!",
+        NOT_FOUND: "باركود غير موجود في النظام!",
+        BARCODE_INACTIVE: "⚠ باركود غير مفعل - العميل: {name}",
+        SUBSCRIPTION_EXPIRED: "⚠ الاشتراك منتهي - العميل: {name}",
+        ALREADY_CHECKED_IN: "⚠ تم تسجيل حضور العميل مسبقاً - العميل: {name}",
+        CHECKED_OUT: "✓ تم تسجيل الخروج - العميل: {name}",
+        ERROR: "خطأ في معالجة الباركود!",
+    }
+    
+    @staticmethod
+    def scan(barcode_data):
+        """Resolve a scanned barcode and check the client in (or out), atomically"""
+        barcode_data = (barcode_data or "").strip()
+        if not BarcodeGenerator.validate_barcode(barcode_data):
+            return ScanResult(CheckInService.INVALID, None, None, None, None)
+        
+        # Decide from the resident index when it knows the barcode
+        entry = barcode_index.get(barcode_data) if barcode_index.loaded else None
+        if entry is not None:
+            return CheckInService._check_in(entry.client_id, entry.status, entry.client_name,
+                                            entry.subscription_end)
+        
+        try:
+            # Take the write lock up front so the checks and the insert cannot race
+            with transaction(immediate=True) as conn:
+                row = conn.execute("""
+                SELECT b.id, b.client_id, b.status, c.subscription_end, c.name
+                FROM barcodes b
+                JOIN clients c ON c.id = b.client_id
+                WHERE b.barcode_data = ?
+                """, (barcode_data,)).fetchone()
+                
+                if row is None:
+                    return ScanResult(CheckInService.NOT_FOUND, None, None, None, None)
+                
+                entry = BarcodeEntry(*row)
+                barcode_index.put(barcode_data, entry)
+                return CheckInService._check_in(entry.client_id, entry.status, entry.client_name,
+                                                entry.subscription_end)
+        except Exception as e:
+            print(f"Error processing scan: {e}")
+            return ScanResult(CheckInService.ERROR, None, None, None, None)
+    
+    @staticmethod
+    def _check_in(client_id, barcode_status, client_name, subscription_end):
+        """Check out an open visit, or apply the scan checks and insert the attendance row"""
+        try:
+            with transaction(immediate=True) as conn:
+                # A scan during an open visit is a check-out, whatever the card's status now
+                if AttendanceDB.checkout_on_scan:
+                    visit = AttendanceDB.find_open_visit(conn, client_id)
+                    if visit is not None:
+                        return CheckInService._check_out(conn, visit, client_id, client_name,
+                                                         subscription_end)
+                
+                # The expiry sweeper also deactivates the barcode, so report the reason first
+                if subscription_end and subscription_end < date.today().strftime("%Y-%m-%d"):
+                    return ScanResult(CheckInService.SUBSCRIPTION_EXPIRED, client_id, client_name,
+                                      subscription_end, None)
+                
+                if barcode_status != BarcodeManager.ACTIVE:
+                    return ScanResult(CheckInService.BARCODE_INACTIVE, client_id, client_name,
+                                      subscription_end, None)
+                
+                attendance_id = AttendanceDB.insert_attendance(conn, client_id)
+            if attendance_id is None:
+                # Rejected by the one-per-day or anti-passback policy
+                return ScanResult(CheckInService.ALREADY_CHECKED_IN, client_id, client_name,
+                                  subscription_end, None)
+            return ScanResult(CheckInService.OK, client_id, client_name,
+                              subscription_end, attendance_id)
+        except Exception as e:
+            print(f"Error processing scan: {e}")
+            return ScanResult(CheckInService.ERROR, None, None, None, None)
+    
+    @staticmethod
+    def _check_out(conn, visit, client_id, client_name, subscription_end):
+        """Close an open visit unless the scan repeats a check-in moments ago"""
+        attendance_id, check_in_time = visit
+        min_stay = datetime.now() - timedelta(minutes=AttendanceDB.min_visit_minutes)
+        if check_in_time > min_stay.strftime("%Y-%m-%d %H:%M:%S"):
+            return ScanResult(CheckInService.ALREADY_CHECKED_IN, client_id, client_name,
+                              subscription_end, None)
+        
+        AttendanceDB.close_visit(conn, attendance_id)
+        return ScanResult(CheckInService.CHECKED_OUT, client_id, client_name,
+                          subscription_end, attendance_id)
+    
+    @staticmethod
+    def describe(result):
+        """Get the display message for a scan result"""
+        return CheckInService.MESSAGES[result.status].format(name=result.client_name)
+
+def benchmark_scan(clients=5000, scans=2000, use_index=False):
+    """Measure scan latency on a temporary database (returns milliseconds)"""
+    import os
+    import random
+    import tempfile
+    import database
+    
+    previous_path = database.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database.configure(db_path=os.path.join(tmp_dir, "benchmark.db"))
+        try:
+            database.init_db()
+            codes = []
+            with transaction() as conn:
+                for i in range(clients):
+                    client_id = conn.execute("""
+                    INSERT INTO clients (name, subscription_type, subscription_start, subscription_end)
+                    VALUES (?, 'شهري', '2024-01-01', '2099-12-31')
+                    """, (f"Client {i}",)).lastrowid
+                    code = BarcodeGenerator.generate_barcode_data(client_id)
+                    conn.execute("INSERT INTO barcodes (client_id, barcode_data) VALUES (?, ?)",
+                                 (client_id, code))
+                    codes.append(code)
+            
+            if use_index:
+                barcode_index.load()
+            
+            # Distinct clients, so every scan is a first check-in rather than a check-out
+            timings = []
+            for code in random.sample(codes, min(scans, clients)):
+                start = time.perf_counter()
+                result = CheckInService.scan(code)
+                timings.append((time.perf_counter() - start) * 1000)
+                assert result.status == CheckInService.OK, result
+        finally:
+            barcode_index.clear()
+            database.configure(db_path=previous_path)
+    
+    timings.sort()
+    return {
+        "p50": timings[len(timings) // 2],
+        "p95": timings[int(len(timings) * 0.95)],
+        "p99": timings[int(len(timings) * 0.99)],
+        "max": timings[-1],
+    }
+
+if __name__ == "__main__":
+    for use_index in (False, True):
+        stats = benchmark_scan(use_index=use_index)
+        label = "resident index" if use_index else "SQLite"
+        print(f"Scan latency via {label} (ms): " + ", ".join(f"{key}={value:.2f}" for key, value in stats.items()))
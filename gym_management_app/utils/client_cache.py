@@ -0,0 +1,104 @@
+import threading
+
+class ClientCache:
+    """Read-through copy of the clients table, shared by all pages.
+    
+    The cache is valid for one data version. ClientDB writes bump the version
+    directly. Writes made through other connections (other threads or other
+    processes) are detected with PRAGMA data_version, which changes whenever
+    another connection commits; only then is the trigger-maintained clients
+    version read to tell client changes from unrelated writes.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = 0
+        self._clients = None
+        self._by_id = {}
+        self._db_version = None
+        self._seen = {}  # id(connection) -> last PRAGMA data_version
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+    
+    def invalidate(self):
+        """Drop cached clients after a write"""
+        with self._lock:
+            self._drop()
+    
+    def clear(self):
+        """Drop cached clients and connection state (connections were closed)"""
+        with self._lock:
+            self._drop()
+            self._seen.clear()
+            self._db_version = None
+    
+    def forget_connection(self, conn):
+        """Drop the data_version seen on a connection that is being closed"""
+        with self._lock:
+            self._seen.pop(id(conn), None)
+    
+    def _drop(self):
+        """Bump the version and forget the data (lock held)"""
+        self.version += 1
+        self._clients = None
+        self._by_id = {}
+        self.invalidations += 1
+    
+    def _check(self, conn):
+        """Invalidate if another connection changed the clients table (lock held)"""
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if self._seen.get(id(conn)) == data_version:
+            return
+        self._seen[id(conn)] = data_version
+        
+        row = conn.execute("SELECT version FROM data_versions WHERE name = 'clients'").fetchone()
+        db_version = row[0] if row else None
+        if db_version != self._db_version:
+            if self._db_version is not None:
+                self._drop()
+            self._db_version = db_version
+    
+    def get_all(self, conn, load):
+        """Get all clients, calling load(conn) on a miss"""
+        with self._lock:
+            self._check(conn)
+            if self._clients is not None:
+                self.hits += 1
+                return list(self._clients)
+            self.misses += 1
+            version = self.version
+        
+        clients = load(conn)
+        with self._lock:
+            # Don't keep data that a concurrent write already made stale
+            if self.version == version:
+                self._clients = clients
+                self._by_id = {client.id: client for client in clients}
+        return list(clients)
+    
+    def get(self, conn, client_id, load):
+        """Get one client, calling load(conn, client_id) when the table is not cached"""
+        with self._lock:
+            self._check(conn)
+            if self._clients is not None:
+                self.hits += 1
+                return self._by_id.get(client_id)
+            self.misses += 1
+        return load(conn, client_id)
+    
+    def stats(self):
+        """Get cache size and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._by_id),
+                "version": self.version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+# Shared instance used by ClientDB
+client_cache = ClientCache()
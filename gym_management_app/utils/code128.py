@@ -0,0 +1,210 @@
+"""
+Native Code128 encoder and NumPy rasterizer
+
+Encodes printable ASCII with code set B, switching to code set C for runs
+of four or more digits, and renders the module array straight to a PNG
+without going through python-barcode's generic ImageWriter.
+"""
+
+from functools import lru_cache
+import struct
+import zlib
+
+import numpy as np
+
+# Bar/space widths of symbol values 0-105
+PATTERNS = [
+    "212222", "222122", "222221", "121223", "121322", "131222", "122213", "122312", "132212", "221213",
+    "221312", "231212", "112232", "122132", "122231", "113222", "123122", "123221", "223211", "221132",
+    "221231", "213212", "223112", "312131", "311222", "321122", "321221", "312212", "322112", "322211",
+    "212123", "212321", "232121", "111323", "131123", "131321", "112313", "132113", "132311", "211313",
+    "231113", "231311", "112133", "112331", "132131", "113123", "113321", "133121", "313121", "211331",
+    "231131", "213113", "213311", "213131", "311123", "311321", "331121", "312113", "312311", "332111",
+    "314111", "221411", "431111", "111224", "111422", "121124", "121421", "141122", "141221", "112214",
+    "112412", "122114", "122411", "142112", "142211", "241211", "221114", "413111", "241112", "134111",
+    "111242", "121142", "121241", "114212", "124112", "124211", "411212", "421112", "421211", "212141",
+    "214121", "412121", "111143", "111341", "131141", "114113", "114311", "411113", "411311", "113141",
+    "114131", "311141", "411131", "211412", "211214", "211232",
+]
+STOP_PATTERN = "2331112"
+
+CODE_C = 99
+CODE_B = 100
+START_B = 104
+START_C = 105
+
+# Module bit arrays per symbol (1 = bar)
+_SYMBOL_BITS = []
+for _pattern in PATTERNS + [STOP_PATTERN]:
+    _bits = []
+    for _index, _width in enumerate(_pattern):
+        _bits.extend([1 - _index % 2] * int(_width))
+    _SYMBOL_BITS.append(np.array(_bits, dtype=np.uint8))
+_STOP_BITS = _SYMBOL_BITS.pop()
+
+_WIDTHS_TO_VALUE = {pattern: value for value, pattern in enumerate(PATTERNS)}
+
+def _digit_run(data, start):
+    """Length of the run of digits starting at start"""
+    end = start
+    while end < len(data) and data[end].isdigit() and data[end].isascii():
+        end += 1
+    return end - start
+
+def encode(data):
+    """Encode data to Code128 symbol values, including start and check symbols"""
+    if not data:
+        raise ValueError("Code128 data must not be empty")
+    for char in data:
+        if not 32 <= ord(char) <= 126:
+            raise ValueError(f"Character {char!r} cannot be encoded in Code128 set B/C")
+    
+    values = []
+    position = 0
+    code_set = None
+    while position < len(data):
+        run = _digit_run(data, position)
+        if run >= 4 or (run >= 2 and run == len(data)):
+            # An odd leading digit goes out in set B so set C gets whole pairs
+            if run % 2:
+                if code_set != "B":
+                    values.append(START_B if code_set is None else CODE_B)
+                    code_set = "B"
+                values.append(ord(data[position]) - 32)
+                position += 1
+                run -= 1
+            if code_set != "C":
+                values.append(START_C if code_set is None else CODE_C)
+                code_set = "C"
+            for offset in range(position, position + run, 2):
+                values.append(int(data[offset:offset + 2]))
+            position += run
+        else:
+            if code_set != "B":
+                values.append(START_B if code_set is None else CODE_B)
+                code_set = "B"
+            values.append(ord(data[position]) - 32)
+            position += 1
+    
+    checksum = values[0] + sum(index * value for index, value in enumerate(values[1:], start=1))
+    values.append(checksum % 103)
+    return values
+
+def modules(data):
+    """Get the module array (1 = bar) for data, without quiet zones"""
+    return np.concatenate([_SYMBOL_BITS[value] for value in encode(data)] + [_STOP_BITS])
+
+def bar_runs(data):
+    """Get (start, end) module offsets of each bar, for vector renderers"""
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], modules(data), [0]))))
+    return list(zip(edges[::2].tolist(), edges[1::2].tolist()))
+
+def decode_modules(bits):
+    """Decode a module array back to its data (used to verify renderers)"""
+    bits = "".join(str(int(bit)) for bit in bits).strip("0")
+    widths = []
+    count = 1
+    for previous, current in zip(bits, bits[1:]):
+        if current == previous:
+            count += 1
+        else:
+            widths.append(str(count))
+            count = 1
+    widths.append(str(count))
+    
+    values = [_WIDTHS_TO_VALUE["".join(widths[i:i + 6])] for i in range(0, len(widths) - 7, 6)]
+    if "".join(widths[-7:]) != STOP_PATTERN:
+        raise ValueError("missing stop pattern")
+    *values, checksum = values
+    if (values[0] + sum(index * value for index, value in enumerate(values[1:], start=1))) % 103 != checksum:
+        raise ValueError("checksum mismatch")
+    
+    code_set = {START_B: "B", START_C: "C"}.get(values[0])
+    if code_set is None:
+        raise ValueError("unsupported start code")
+    data = []
+    for value in values[1:]:
+        if value == CODE_B and code_set == "C":
+            code_set = "B"
+        elif value == CODE_C and code_set == "B":
+            code_set = "C"
+        elif code_set == "C":
+            data.append(f"{value:02d}")
+        else:
+            data.append(chr(value + 32))
+    return "".join(data)
+
+def render_bars(data, module_width=2, height=120, quiet_zone=10):
+    """Rasterize the bars to a grayscale array (0 = bar, 255 = background)"""
+    bits = np.pad(modules(data), quiet_zone)
+    row = np.repeat(np.where(bits, 0, 255).astype(np.uint8), module_width)
+    return np.broadcast_to(row, (height, row.size))
+
+@lru_cache(maxsize=8)
+def _font(size):
+    """Load the default font once per size"""
+    from PIL import ImageFont
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()  # Pillow < 10.1 has a fixed size default font
+
+@lru_cache(maxsize=8)
+def _line_height(size):
+    """Pixel height of a text line for the font size"""
+    printable = "".join(chr(code) for code in range(32, 127))
+    return _font(size).getbbox(printable)[3] + 2
+
+@lru_cache(maxsize=1024)
+def _glyph(char, size):
+    """Rasterize one character once; text is composed from cached glyphs"""
+    from PIL import Image, ImageDraw
+    font = _font(size)
+    width = max(1, int(round(font.getlength(char))))
+    image = Image.new("L", (width, _line_height(size)), 255)
+    ImageDraw.Draw(image).text((0, 0), char, fill=0, font=font)
+    return np.asarray(image)
+
+def render_text(data, size=20):
+    """Rasterize the human readable text line (needs Pillow for the glyphs)"""
+    return np.hstack([_glyph(char, size) for char in data])
+
+def render(data, module_width=2, height=120, quiet_zone=10, text=True, font_size=20):
+    """Rasterize data to a grayscale array, with the human readable text if requested"""
+    bars = render_bars(data, module_width, height, quiet_zone)
+    if not text:
+        return bars
+    
+    try:
+        label = render_text(data, font_size)[:, :bars.shape[1]]
+    except ImportError:
+        return bars  # Without Pillow only the bars are drawn
+    
+    margin = 4
+    canvas = np.full((height + margin + label.shape[0], bars.shape[1]), 255, dtype=np.uint8)
+    canvas[:height] = bars
+    left = (bars.shape[1] - label.shape[1]) // 2
+    canvas[height + margin:, left:left + label.shape[1]] = label
+    return canvas
+
+def encode_png(pixels):
+    """Encode a grayscale array as a 1-bit PNG (bars and text are two-tone)"""
+    height, width = pixels.shape
+    packed = np.packbits(np.asarray(pixels) >= 128, axis=1)
+    raw = np.zeros((height, packed.shape[1] + 1), dtype=np.uint8)
+    raw[:, 1:] = packed  # Filter type 0 for every scanline
+    
+    def chunk(kind, payload):
+        return (struct.pack(">I", len(payload)) + kind + payload
+                + struct.pack(">I", zlib.crc32(kind + payload) & 0xFFFFFFFF))
+    
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 1, 0, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+            + chunk(b"IEND", b""))
+
+def save_png(data, path, module_width=2, height=120, quiet_zone=10, text=True):
+    """Render data and write it as a PNG file"""
+    with open(path, "wb") as f:
+        f.write(encode_png(render(data, module_width, height, quiet_zone, text)))
+    return path
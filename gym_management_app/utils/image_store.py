@@ -0,0 +1,131 @@
+"""
+Sharded, content-addressed barcode image store
+
+An image is fully determined by its barcode data, so it is stored under the
+SHA-256 of that data in two levels of hash-prefix directories
+(barcodes/ab/cd/abcd....png). Stored images are tracked in the
+barcode_images table so expired and renewed codes can be garbage collected.
+"""
+
+import hashlib
+import os
+import re
+
+from database import BarcodeImageDB
+
+# Images written by the flat layout: barcodes/barcode_<data>.png
+_LEGACY_NAME = re.compile(r"barcode_(.+)\.png")
+
+class BarcodeImageStore:
+    def __init__(self, root="barcodes"):
+        self.root = root
+    
+    @staticmethod
+    def digest(barcode_data):
+        """Content address of a barcode image"""
+        return hashlib.sha256(barcode_data.encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def relative_path(digest):
+        """Path of an image inside the store"""
+        return os.path.join(digest[:2], digest[2:4], f"{digest}.png")
+    
+    def path_for(self, barcode_data):
+        """Full path of the image for barcode data"""
+        return os.path.join(self.root, self.relative_path(self.digest(barcode_data)))
+    
+    def exists(self, barcode_data):
+        """Check whether the image for barcode data is stored"""
+        return os.path.exists(self.path_for(barcode_data))
+    
+    def save(self, barcode_data, png_bytes, record=True):
+        """Write an image atomically and return its path.
+        
+        Worker processes pass record=False and the parent records the
+        images in one batch with record_images().
+        """
+        path = self.path_for(barcode_data)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(png_bytes)
+        os.replace(tmp_path, path)
+        
+        if record:
+            BarcodeImageDB.record_images([(barcode_data, self.digest(barcode_data), len(png_bytes))])
+        return path
+    
+    def record_images(self, barcode_datas):
+        """Record already written images in the database"""
+        rows = []
+        for barcode_data in barcode_datas:
+            path = self.path_for(barcode_data)
+            if os.path.exists(path):
+                rows.append((barcode_data, self.digest(barcode_data), os.path.getsize(path)))
+        return BarcodeImageDB.record_images(rows)
+    
+    def load(self, barcode_data):
+        """Read an image, or None if it is not stored"""
+        try:
+            with open(self.path_for(barcode_data), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+    
+    def _remove(self, digest):
+        """Delete an image file and prune its emptied shard directories"""
+        path = os.path.join(self.root, self.relative_path(digest))
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        
+        shard = os.path.dirname(path)
+        for _ in range(2):
+            try:
+                os.rmdir(shard)  # Only succeeds when the shard is empty
+            except OSError:
+                break
+            shard = os.path.dirname(shard)
+    
+    def collect_garbage(self, batch_size=500):
+        """Remove images of expired, renewed and deleted barcodes; returns the count"""
+        removed = 0
+        while True:
+            stale = BarcodeImageDB.get_stale_images(batch_size)
+            if not stale:
+                return removed
+            for _, digest in stale:
+                self._remove(digest)
+            if not BarcodeImageDB.delete_images([barcode_data for barcode_data, _ in stale]):
+                return removed
+            removed += len(stale)
+    
+    def migrate_flat_images(self, limit=500):
+        """Move up to limit images of the flat layout into the store.
+        
+        Called repeatedly (e.g. once per start-up) until it returns 0, so a
+        large legacy directory is moved over incrementally.
+        """
+        if not os.path.isdir(self.root):
+            return 0
+        
+        legacy = []
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if len(legacy) >= limit:
+                    break
+                match = _LEGACY_NAME.fullmatch(entry.name)
+                if match and entry.is_file():
+                    legacy.append((entry.path, match.group(1)))
+        
+        moved = []
+        for legacy_path, barcode_data in legacy:
+            path = self.path_for(barcode_data)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(legacy_path, path)
+            moved.append(barcode_data)
+        
+        # Recorded images of dead codes are removed by the next collection
+        self.record_images(moved)
+        return len(moved)
@@ -0,0 +1,57 @@
+import re
+
+# Arabic diacritics (tashkeel), superscript alef and tatweel
+_DIACRITICS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+
+# Letter forms folded to a single search form
+_LETTER_MAP = str.maketrans({
+    "أ": "ا",
+    "إ": "ا",
+    "آ": "ا",
+    "ٱ": "ا",
+    "ة": "ه",
+    "ى": "ي",
+})
+
+# Arabic-Indic and Eastern Arabic-Indic digits to ASCII
+_DIGIT_MAP = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+
+_NON_DIGITS = re.compile(r"[^0-9]")
+
+# Digits and the separators people type inside phone numbers
+_PHONE_CHARS = re.compile(r"[0-9\s+()./-]+")
+
+_WORDS = re.compile(r"\w+")
+
+def normalize_name(text):
+    """Normalize text for searching (Arabic letter forms, diacritics, case, spaces)"""
+    if not text:
+        return ""
+    text = _DIACRITICS.sub("", text)
+    text = text.translate(_LETTER_MAP).translate(_DIGIT_MAP)
+    return " ".join(text.casefold().split())
+
+def phone_digits(text):
+    """Keep only the digits of a phone number (Arabic-Indic digits included)"""
+    if not text:
+        return ""
+    return _NON_DIGITS.sub("", text.translate(_DIGIT_MAP))
+
+def is_phone_like(text):
+    """Check whether text is a (possibly formatted) phone number or part of one"""
+    if not phone_digits(text):
+        return False
+    return _PHONE_CHARS.fullmatch(text.translate(_DIGIT_MAP)) is not None
+
+def search_terms(text):
+    """Split normalized text into words the way the search index tokenizes it"""
+    return _WORDS.findall(normalize_name(text))
+
+def trigrams(text):
+    """Get the set of padded character trigrams of normalized text"""
+    grams = set()
+    for word in normalize_name(text).split():
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams